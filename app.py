@@ -1,15 +1,34 @@
-from datetime import date, datetime
-from typing import Dict, List, Optional, Tuple, Union, Any
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Any
 import logging
 import os
 
 from mwoauth import ConsumerToken, Handshaker, RequestToken
-from flask import Flask, Response, jsonify, redirect, request, send_from_directory, send_file
+from flask import Flask, Response, jsonify, redirect, request, url_for
 from flask import session as flask_session
 from flask_cors import CORS
 from extensions import db, migrate
+from db_pool import binds, engine_options, pool_stats, read_replica
 from config import config
-from models import Book, Contest, ContestAdmin, IndexPage, User
+from models import (
+    Book,
+    Contest,
+    ContestAdmin,
+    ContestUserScore,
+    ContributionRollup,
+    IndexPage,
+    Job,
+    User,
+    association_table,
+    book_contest_association_table,
+)
+from jobs import job_queue, job_to_dict, run_pending
+from live_leaderboard import broadcaster
+from metrics import metrics
+from response_cache import bump_generation, response_cache
+from static_assets import StaticManifest
+from sqlalchemy import func, literal
+from sync_store import BUCKET_FORMATS, contest_window, insert_ignore, refresh_rollups, refresh_scores, time_bucket
 
 # Configure logging
 logging.basicConfig(
@@ -27,13 +46,29 @@ if not os.path.exists(static_folder):
         static_folder = None
         logger.warning("Frontend dist folder not found. Build the frontend first with 'npm run build'")
 
-app: Flask = Flask(__name__, static_folder=static_folder, static_url_path='')
+# The frontend is served from an in-memory manifest instead of Flask's static route
+app: Flask = Flask(__name__, static_folder=None)
+static_manifest: StaticManifest = StaticManifest(static_folder)
 app.secret_key = config["APP_SECRET_KEY"]
 
 app.config['SQLALCHEMY_DATABASE_URI'] = config["SQL_URI"]
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config["SQL_URI"])
+app.config['SQLALCHEMY_BINDS'] = binds()
+app.config['RESPONSE_CACHE_BACKEND'] = config["RESPONSE_CACHE_BACKEND"]
+app.config['RESPONSE_CACHE_SIZE'] = config["RESPONSE_CACHE_SIZE"]
+app.config['RESPONSE_CACHE_DIR'] = config["RESPONSE_CACHE_DIR"]
+app.config['JOB_WORKERS'] = config["JOB_WORKERS"]
+app.config['LIVE_POLL_INTERVAL'] = config["LIVE_POLL_INTERVAL"]
+app.config['LIVE_HEARTBEAT'] = config["LIVE_HEARTBEAT"]
+app.config['METRICS_SLOW_REQUEST_SECONDS'] = config["METRICS_SLOW_REQUEST_SECONDS"]
+app.config['METRICS_ALLOWED_IPS'] = config["METRICS_ALLOWED_IPS"]
 db.init_app(app)
 migrate.init_app(app, db)
+response_cache.init_app(app)
+job_queue.init_app(app)
+broadcaster.init_app(app)
+metrics.init_app(app)
 
 consumer_token: ConsumerToken = ConsumerToken(
     config["CONSUMER_KEY"], config["CONSUMER_SECRET"]
@@ -48,8 +83,8 @@ CORS(app, origins=[config["FRONTEND_URL"]], supports_credentials=True)
 @app.route('/')
 def serve_frontend():
     """Serve the main frontend application"""
-    if app.static_folder and os.path.exists(os.path.join(app.static_folder, 'index.html')):
-        return send_from_directory(app.static_folder, 'index.html')
+    if static_manifest.index is not None:
+        return static_manifest.response(static_manifest.index, request)
     else:
         return jsonify({"message": "Frontend not built. Run 'npm run build' in the wscontest directory and copy dist folder to backend."}), 404
 
@@ -82,14 +117,12 @@ def serve_static_files(path):
     if path.startswith('api/'):
         return jsonify({"error": "API endpoint not found"}), 404
     
-    if app.static_folder:
-        file_path = os.path.join(app.static_folder, path)
-        if os.path.exists(file_path):
-            return send_from_directory(app.static_folder, path)
-        else:
-            # For Vue Router - serve index.html for unknown routes (SPA routing)
-            if os.path.exists(os.path.join(app.static_folder, 'index.html')):
-                return send_from_directory(app.static_folder, 'index.html')
+    asset = static_manifest.assets.get(path)
+    if asset is not None:
+        return static_manifest.response(asset, request)
+    # For Vue Router - serve index.html for unknown routes (SPA routing)
+    if static_manifest.index is not None:
+        return static_manifest.response(static_manifest.index, request)
     return jsonify({"error": "File not found"}), 404
 
 
@@ -167,9 +200,135 @@ def get_user_info() -> Tuple[Response, int]:
             "userid": None
         }), 200
 
+# Longest series /api/graph-data returns, e.g. 41 days of hours or 2.7 years of days
+GRAPH_MAX_BUCKETS: int = 1000
+GRAPH_BUCKET_SIZES: Dict[str, timedelta] = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+GRAPH_GROUPS: Dict[str, Any] = {
+    "contest": ContributionRollup.contest_cid,
+    "user": ContributionRollup.user_name,
+    "lang": Contest.lang,
+}
+
+
 @app.route("/api/graph-data", methods=["GET"])
-def graph_data() -> Response:
-    return jsonify("graph data here")
+@read_replica
+@response_cache.cached
+def graph_data() -> Tuple[Response, int]:
+    """Proofreads and validations per ``bucket`` (``hour`` or ``day``) between ``start`` and ``end``.
+
+    Filters: ``contest``, ``user`` and ``lang``. ``group_by`` (``contest``, ``user`` or
+    ``lang``) splits the totals into one series per key, for the ``top`` keys with
+    the most contributions. Every series has one value per label, gaps are zeros.
+    The range defaults to the contest when one is given, else the last 30 days.
+    """
+    bucket: str = request.args.get("bucket", "day")
+    group_by: Optional[str] = request.args.get("group_by")
+    if bucket not in GRAPH_BUCKET_SIZES:
+        return jsonify({"error": "bucket must be hour or day"}), 400
+    if group_by is not None and group_by not in GRAPH_GROUPS:
+        return jsonify({"error": "group_by must be contest, user or lang"}), 400
+    top: int = min(max(request.args.get("top", 10, type=int), 1), 50)
+
+    contest: Optional[Contest] = None
+    if request.args.get("contest"):
+        contest_cid: Optional[int] = request.args.get("contest", type=int)
+        if contest_cid is None:
+            return jsonify({"error": "contest must be a contest id"}), 400
+        contest = db.session.get(Contest, contest_cid)
+        if contest is None:
+            return jsonify({"error": "Contest with this id does not exist!"}), 404
+    try:
+        if request.args.get("end"):
+            end_date = date.fromisoformat(request.args["end"])
+        else:
+            end_date = min(contest.end_date.date(), date.today()) if contest else date.today()
+        if request.args.get("start"):
+            start_date = date.fromisoformat(request.args["start"])
+        else:
+            start_date = contest.start_date.date() if contest else end_date - timedelta(days=29)
+    except ValueError:
+        return jsonify({"error": "start and end must be dates like 2024-01-31"}), 400
+    if not request.args.get("end"):
+        # A contest that has not started yet has an empty series, not an invalid range
+        end_date = max(end_date, start_date)
+    start = datetime.combine(start_date, datetime.min.time())
+    end = datetime.combine(end_date, datetime.min.time()) + timedelta(days=1)
+    size = GRAPH_BUCKET_SIZES[bucket]
+    if end <= start or (end - start) / size > GRAPH_MAX_BUCKETS:
+        return jsonify({"error": f"The range must hold between 1 and {GRAPH_MAX_BUCKETS} {bucket}s"}), 400
+
+    def filtered(stmt: Any) -> Any:
+        stmt = stmt.select_from(ContributionRollup).where(ContributionRollup.bucket_start >= start).where(ContributionRollup.bucket_start < end)
+        if contest is not None:
+            stmt = stmt.where(ContributionRollup.contest_cid == contest.cid)
+        if request.args.get("user"):
+            stmt = stmt.where(ContributionRollup.user_name == request.args["user"])
+        if request.args.get("lang") or group_by == "lang":
+            stmt = stmt.join(Contest, Contest.cid == ContributionRollup.contest_cid)
+        if request.args.get("lang"):
+            stmt = stmt.where(Contest.lang == request.args["lang"])
+        return stmt
+
+    proofread = func.sum(ContributionRollup.proofread_count)
+    validated = func.sum(ContributionRollup.validated_count)
+    bucket_column = time_bucket(ContributionRollup.bucket_start, bucket)
+    keys: Optional[List[Any]] = None
+    if group_by:
+        key_column = GRAPH_GROUPS[group_by]
+        keys = db.session.scalars(filtered(
+            db.select(key_column).group_by(key_column).order_by((proofread + validated).desc(), key_column).limit(top)
+        )).all()
+        stmt = filtered(
+            db.select(key_column, bucket_column, proofread, validated).group_by(key_column, bucket_column)
+        ).where(key_column.in_(keys))
+    else:
+        stmt = filtered(db.select(literal(None), bucket_column, proofread, validated).group_by(bucket_column))
+
+    labels: List[datetime] = []
+    current = start
+    while current < end:
+        labels.append(current)
+        current += size
+    positions = {label.strftime(BUCKET_FORMATS[bucket]): index for index, label in enumerate(labels)}
+    series: Dict[Any, Dict[str, Any]] = {
+        key: {"key": key, "proofread": [0] * len(labels), "validated": [0] * len(labels)}
+        for key in (keys if keys is not None else [None])
+    }
+    for key, bucket_start, proofread_count, validated_count in db.session.execute(stmt):
+        position = positions[bucket_start]
+        series[key]["proofread"][position] = int(proofread_count)
+        series[key]["validated"][position] = int(validated_count)
+
+    return jsonify({
+        "bucket": bucket,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "labels": [label.isoformat() for label in labels],
+        "series": list(series.values()),
+    }), 200
+
+
+def parse_contest_lines(text: str, field: str, errors: List[Dict[str, Any]], index_title: bool = False) -> List[str]:
+    """Names given one per line, without duplicates; bad lines are reported in ``errors``.
+
+    Book lines are index titles such as ``Index:Example.djvu``, the namespace is dropped.
+    """
+    names: Dict[str, None] = {}
+    for number, line in enumerate(text.split("\n"), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if index_title:
+            _, colon, line = line.partition(":")
+            line = line.strip()
+            if not colon or not line:
+                errors.append({"field": field, "line": number, "message": "Expected an index title like Index:Example.djvu"})
+                continue
+        if len(line) > 190:
+            errors.append({"field": field, "line": number, "message": "Name is longer than 190 characters"})
+            continue
+        names[line] = None
+    return list(names)
 
 
 @app.route("/api/contest/create", methods=["POST"])
@@ -194,60 +353,132 @@ def create_contest() -> Tuple[Response, int]:
                 point_per_validate=int(data["validate_points"]),
                 lang=data["language"],
             )
-            db.session.add(contest)
+            errors: List[Dict[str, Any]] = []
+            book_names = parse_contest_lines(data.get("book_names") or "", "book_names", errors, index_title=True)
+            admin_names = parse_contest_lines(data.get("admins") or "", "admins", errors)
+            if not book_names:
+                return jsonify({"success": False, "message": "No valid book given", "errors": errors}), 400
 
-            book_names: List[str] = data.get("book_names").split("\n")
-            for book in book_names:
-                book_name = book.split(":")[1]
-                existing_book: Optional[Book] = Book.query.filter_by(name=book_name).first()
-                if existing_book:
-                    # Book already exists, add this contest to it if not already added
-                    if contest not in existing_book.contests:
-                        existing_book.contests.append(contest)
-                else:
-                    # Create new book and add the contest to it
-                    new_book = Book(name=book_name)
-                    new_book.contests.append(contest)
-                    db.session.add(new_book)
-
-            admins: List[str] = data.get("admins").split("\n")
-            for admin_name in admins:
-                admin: Optional[ContestAdmin] = ContestAdmin.query.filter_by(user_name=admin_name).first()
-                if admin:
-                    admin.contests.append(contest)
-                else:
-                    db.session.add(ContestAdmin(user_name=admin_name, contests=[contest]))
+            db.session.add(contest)
+            db.session.flush()
 
+            # Set-based writes: the query count does not grow with the number of lines
+            db.session.execute(insert_ignore(Book.__table__), [{"name": name} for name in book_names])
+            db.session.execute(
+                book_contest_association_table.insert(),
+                [{"contest_cid": contest.cid, "book_name": name} for name in book_names],
+            )
+            if admin_names:
+                db.session.execute(insert_ignore(ContestAdmin.__table__), [{"user_name": name} for name in admin_names])
+                db.session.execute(
+                    association_table.insert(),
+                    [{"contest_cid": contest.cid, "contest_admin_user_name": name} for name in admin_names],
+                )
+
+            # Validating the books and the first sync run in the background
+            job: Job = job_queue.enqueue("setup_contest", contest.cid)
+            bump_generation()
             db.session.commit()
-
-            return jsonify({"success": True}), 200
+            job_queue.start(job.id)
+
+            return jsonify({
+                "success": True,
+                "id": contest.cid,
+                "errors": errors,
+                "job_id": job.id,
+                "job_url": url_for("job_status", id=job.id),
+            }), 202
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Error creating contest: {e}")
             return jsonify({"success": False, "message": str(e)}), 404
 
 
+# Output field of /api/contests -> contest columns needed to build it
+CONTEST_LIST_FIELDS: Dict[str, List[str]] = {
+    "id": ["cid"],
+    "name": ["name"],
+    "start_date": ["start_date"],
+    "end_date": ["end_date"],
+    "status": ["end_date", "status"],
+    "lang": ["lang"],
+    "created_by": ["created_by"],
+}
+DEFAULT_CONTEST_LIST_FIELDS: List[str] = ["id", "name", "start_date", "end_date", "status"]
+
+
 @app.route("/api/contests", methods=["GET"])
+@read_replica
+@response_cache.cached
 def contest_list() -> Tuple[Response, int]:
-    contests: List[Contest] = Contest.query.all()
-    
+    """Contests ordered by end date, newest first, ``limit`` at a time.
+
+    Filters: ``lang``, ``created_by`` and ``state`` (``running`` or ``ended``).
+    ``fields`` selects the keys of each contest, only their columns are loaded.
+    The cursor of the next page is sent in the ``Link`` and ``X-Next-Cursor`` headers.
+    """
+    fields: List[str] = request.args["fields"].split(",") if request.args.get("fields") else DEFAULT_CONTEST_LIST_FIELDS
+    unknown = [field for field in fields if field not in CONTEST_LIST_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    limit: int = min(max(request.args.get("limit", 50, type=int), 1), 200)
+
+    columns = {"cid", "end_date"}.union(*(CONTEST_LIST_FIELDS[field] for field in fields))
+    stmt = db.select(*(getattr(Contest, column) for column in sorted(columns))).order_by(
+        Contest.end_date.desc(), Contest.cid.desc()
+    )
+
+    current_date = datetime.now().date()
+    start_of_today = datetime.combine(current_date, datetime.min.time())
+    running = (Contest.end_date >= start_of_today) & (Contest.status.is_(None) | Contest.status.is_(True))
+    if request.args.get("state") == "running":
+        stmt = stmt.where(running)
+    elif request.args.get("state") == "ended":
+        stmt = stmt.where(~running)
+    if request.args.get("lang"):
+        stmt = stmt.where(Contest.lang == request.args["lang"])
+    if request.args.get("created_by"):
+        stmt = stmt.where(Contest.created_by == request.args["created_by"])
+
+    if request.args.get("cursor"):
+        try:
+            end_date, _, cid = request.args["cursor"].rpartition("_")
+            cursor_end, cursor_cid = datetime.fromisoformat(end_date), int(cid)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        stmt = stmt.where(
+            (Contest.end_date < cursor_end) | ((Contest.end_date == cursor_end) & (Contest.cid < cursor_cid))
+        )
+
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+
     result = []
-    for contest in contests:
-        current_date = datetime.now().date()
-        contest_end_date = contest.end_date.date() if hasattr(contest.end_date, 'date') else contest.end_date
-        is_running = current_date <= contest_end_date and contest.status is not False
-        
-        result.append({
-            "id": contest.cid,  
-            "name": contest.name,
-            "start_date": contest.start_date.strftime("%d-%m-%Y"),
-            "end_date": contest.end_date.strftime("%d-%m-%Y"),
-            "status": is_running,  
-        })
-    
-    return jsonify(result), 200
+    for contest in rows[:limit]:
+        item: Dict[str, Any] = {}
+        for field in fields:
+            if field == "id":
+                item["id"] = contest.cid
+            elif field in ("start_date", "end_date"):
+                item[field] = getattr(contest, field).strftime("%d-%m-%Y")
+            elif field == "status":
+                contest_end_date = contest.end_date.date() if hasattr(contest.end_date, 'date') else contest.end_date
+                item["status"] = current_date <= contest_end_date and contest.status is not False
+            else:
+                item[field] = getattr(contest, field)
+        result.append(item)
+
+    response = jsonify(result)
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = f"{last.end_date.isoformat()}_{last.cid}"
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{url_for("contest_list", **{**request.args, "cursor": next_cursor})}>; rel="next"'
+    return response, 200
 
 
 @app.route("/api/contest/<int:id>")
+@read_replica
+@response_cache.cached
 def contest_by_id(id: int) -> Tuple[Response, int]:
     contest: Optional[Contest] = Contest.query.get(id)
     if not contest:
@@ -268,44 +499,90 @@ def contest_by_id(id: int) -> Tuple[Response, int]:
             "lang": contest.lang
         }
         data["adminstrators"] = [admin.user_name for admin in contest.admins]
-        data["books"] = [book.name for book in contest.books]
-
-        data["users"] = []
-        for user in contest.users:
-            proofread_count: int = len(user.proofread_pages)
-            validated_count: int = len(user.validated_pages)
-            points: int = (proofread_count * contest.point_per_proofread) + (
-                validated_count * contest.point_per_validate
-            )
-            
-            user_pages = []
-            contest_book_names = [book.name for book in contest.books]
-            for page in IndexPage.query.filter(
-                (IndexPage.validator_username == user.user_name) |
-                (IndexPage.proofreader_username == user.user_name)
-            ).all():
-                if page.book_name in contest_book_names:
-                    user_pages.append({
-                        "id": page.id,
-                        "page_name": page.page_name,
-                        "book_name": page.book_name,
-                        "validate_time": page.validate_time.isoformat() if page.validate_time else None,
-                        "proofread_time": page.proofread_time.isoformat() if page.proofread_time else None,
-                        "v_revision_id": page.v_revision_id,
-                        "p_revision_id": page.p_revision_id
-                    })
-            
-            data["users"].append({
-                user.user_name: {
-                    "proofread_count": proofread_count,
-                    "validated_count": validated_count,
-                    "points": points,
-                    "pages": user_pages,
+        data["books"] = db.session.scalars(
+            db.select(book_contest_association_table.c.book_name)
+            .where(book_contest_association_table.c.contest_cid == contest.cid)
+        ).all()
+
+        data["users"] = [
+            {
+                score.user_name: {
+                    "proofread_count": score.proofread_count,
+                    "validated_count": score.validated_count,
+                    "points": score.points,
                 }
-            })
+            }
+            for score in ContestUserScore.query.filter_by(contest_cid=contest.cid).order_by(
+                ContestUserScore.points.desc(), ContestUserScore.user_name
+            )
+        ]
         return jsonify(data), 200
 
 
+@app.route("/api/contest/<int:id>/stream")
+@read_replica
+def contest_stream(id: int) -> Tuple[Response, int]:
+    """Server-Sent Events: a ``snapshot`` of the leaderboard, then a ``delta`` with the
+    changed and removed user rows after every sync commit that moved it.
+    """
+    if db.session.get(Contest, id) is None:
+        return jsonify("Contest with this id does not exist!"), 404
+    subscription = broadcaster.subscribe(id)
+    return Response(
+        broadcaster.stream(subscription),
+        mimetype="text/event-stream",
+        # Stop nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    ), 200
+
+
+def contest_user_pages_query(contest: Contest, user_name: str, after: int) -> Any:
+    window_start, window_end = contest_window(contest)
+    return (
+        IndexPage.query
+        .join(book_contest_association_table, book_contest_association_table.c.book_name == IndexPage.book_name)
+        .filter(book_contest_association_table.c.contest_cid == contest.cid)
+        .filter(
+            ((IndexPage.proofreader_username == user_name)
+             & (IndexPage.proofread_time >= window_start) & (IndexPage.proofread_time < window_end)) |
+            ((IndexPage.validator_username == user_name)
+             & (IndexPage.validate_time >= window_start) & (IndexPage.validate_time < window_end))
+        )
+        .filter(IndexPage.id > after)
+        .order_by(IndexPage.id)
+    )
+
+
+@app.route("/api/contest/<int:id>/user/<string:user_name>/pages")
+@read_replica
+@response_cache.cached
+def contest_user_pages(id: int, user_name: str) -> Tuple[Response, int]:
+    """Pages credited to a user in a contest, ``limit`` at a time after page id ``after``"""
+    contest: Optional[Contest] = Contest.query.get(id)
+    if not contest:
+        return jsonify("Contest with this id does not exist!"), 404
+
+    after: int = request.args.get("after", 0, type=int)
+    limit: int = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    pages: List[IndexPage] = contest_user_pages_query(contest, user_name, after).limit(limit + 1).all()
+
+    return jsonify({
+        "pages": [
+            {
+                "id": page.id,
+                "page_name": page.page_name,
+                "book_name": page.book_name,
+                "validate_time": page.validate_time.isoformat() if page.validate_time else None,
+                "proofread_time": page.proofread_time.isoformat() if page.proofread_time else None,
+                "v_revision_id": page.v_revision_id,
+                "p_revision_id": page.p_revision_id
+            }
+            for page in pages[:limit]
+        ],
+        "next_after": pages[limit - 1].id if len(pages) > limit else None,
+    }), 200
+
+
 @app.route("/api/contest/<int:id>/status", methods=["PATCH"])
 def update_contest_status(id: int) -> Tuple[Response, int]:
     current_user = get_current_user(False)
@@ -328,6 +605,7 @@ def update_contest_status(id: int) -> Tuple[Response, int]:
             return jsonify({"success": False, "message": "Status field is required"}), 400
         
         contest.status = new_status
+        bump_generation()
         db.session.commit()
         
         return jsonify({"success": True, "message": f"Contest {'opened' if new_status else 'closed'} successfully"}), 200
@@ -365,7 +643,14 @@ def update_contest(id: int) -> Tuple[Response, int]:
             contest.point_per_proofread = int(data['point_per_proofread'])
         if 'point_per_validate' in data:
             contest.point_per_validate = int(data['point_per_validate'])
+
+        # Points and the counted window are baked into the leaderboard
+        if data.keys() & {'start_date', 'end_date', 'point_per_proofread', 'point_per_validate'}:
+            refresh_scores(contest)
+        if data.keys() & {'start_date', 'end_date'}:
+            refresh_rollups(contest)
         
+        bump_generation()
         db.session.commit()
         
         return jsonify({"success": True, "message": "Contest updated successfully"}), 200
@@ -374,6 +659,41 @@ def update_contest(id: int) -> Tuple[Response, int]:
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@app.route("/api/pool-stats")
+@metrics.internal_only
+def pool_stats_view() -> Tuple[Response, int]:
+    """Pool size, usage and checkout wait per database engine, for sizing DB_POOL_SIZE"""
+    return jsonify(pool_stats(db.engines)), 200
+
+
+@app.route("/api/jobs/<int:id>")
+def job_status(id: int) -> Tuple[Response, int]:
+    job: Optional[Job] = db.session.get(Job, id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_to_dict(job)), 200
+
+
+@app.cli.command("run-jobs")
+def run_jobs_command() -> None:
+    """Run queued background jobs, for deployments with JOB_WORKERS=0"""
+    print(f"{run_pending()} jobs run")
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command() -> None:
+    """EXPLAIN the hot queries and fail if one of them scans a whole table"""
+    from query_plans import check_query_plans
+
+    problems = check_query_plans()
+    for name, lines in problems.items():
+        for line in lines:
+            print(f"{name}: {line}")
+    if problems:
+        raise SystemExit(1)
+    print("All hot queries use an index")
+
+
 if __name__ == "__main__":
     app.run(debug=True)
 
@@ -0,0 +1,250 @@
+"""Benchmarks of the hot endpoints and of db_update on synthetic data.
+
+    python benchmark.py --books 20 --pages 200 --save-baseline bench_baseline.json
+    python benchmark.py --books 20 --pages 200 --baseline bench_baseline.json
+
+Contests are generated into a fresh database (a SQLite file by default, or a
+local MySQL given with ``--db``) and their books are crawled by the real sync
+from a ``wiki_stub`` server, so the data is the same for a given seed and
+scale. Results are printed as a table, next to a saved baseline if one is given.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from config import config
+
+# Results more than this much slower than the baseline are flagged
+REGRESSION_THRESHOLD: float = 0.10
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(description="Benchmark the contest endpoints and the sync")
+    arg_parser.add_argument(
+        "--db", default=f"sqlite:///{os.path.join(tempfile.gettempdir(), 'wscontest-bench.db')}",
+        help="SQLAlchemy URI of a scratch database",
+    )
+    arg_parser.add_argument("--reset", action="store_true", help="drop all tables of --db first, needed if it has data")
+    arg_parser.add_argument("--contests", type=int, default=10, help="running contests, each synced")
+    arg_parser.add_argument("--ended-contests", type=int, default=200, help="ended contests without books")
+    arg_parser.add_argument("--books", type=int, default=20)
+    arg_parser.add_argument("--books-per-contest", type=int, default=4)
+    arg_parser.add_argument("--pages", type=int, default=200, help="pages per book")
+    arg_parser.add_argument("--users", type=int, default=50)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="seconds the stub adds to every API response")
+    arg_parser.add_argument("--repeat", type=int, default=20, help="requests timed per endpoint")
+    arg_parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    arg_parser.add_argument("--save-baseline", help="write the results of this run to this file")
+    return arg_parser.parse_args(argv)
+
+
+def create_contests(args: argparse.Namespace) -> None:
+    from extensions import db
+    from models import Book, Contest, ContestAdmin, association_table, book_contest_association_table
+    from response_cache import bump_generation
+
+    db.session.add(ContestAdmin(user_name="BenchAdmin"))
+    db.session.add_all(Book(name=f"Stub_Book_{n}.djvu") for n in range(args.books))
+    for n in range(args.contests + args.ended_contests):
+        running = n < args.contests
+        contest = Contest(
+            name=f"Bench contest {n}",
+            created_by="BenchAdmin",
+            start_date=dt.datetime(2024, 1, 1),
+            end_date=dt.datetime(2100, 1, 1) if running else dt.datetime(2023, 1, 1) + dt.timedelta(days=n),
+            status=running,
+            point_per_proofread=3,
+            point_per_validate=1,
+            lang="en" if n % 3 else "bn",
+        )
+        db.session.add(contest)
+        db.session.flush()
+        db.session.execute(association_table.insert(), {"contest_cid": contest.cid, "contest_admin_user_name": "BenchAdmin"})
+        if running:
+            # Neighbouring contests share books, as they do on the real wikis
+            books = {(n + offset) % args.books for offset in range(args.books_per_contest)}
+            db.session.execute(
+                book_contest_association_table.insert(),
+                [{"contest_cid": contest.cid, "book_name": f"Stub_Book_{book}.djvu"} for book in sorted(books)],
+            )
+    bump_generation()
+    db.session.commit()
+
+
+def timed(fn: Callable[[], Any]) -> Tuple[float, Any]:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def benchmark_sync(args: argparse.Namespace, stub: Any) -> Dict[str, Dict[str, float]]:
+    import db_update
+
+    results: Dict[str, Dict[str, float]] = {}
+
+    def run(name: str, **kwargs: Any) -> None:
+        seconds, stats = timed(lambda: db_update.run(**kwargs))
+        totals = stats.summary()["totals"]
+        results[name] = {
+            "seconds": seconds,
+            "api_calls": sum(kind["calls"] for kind in totals["api"].values()),
+            "db_seconds": totals["db_seconds"] + totals["db_seconds_outside_books"],
+        }
+
+    run("sync: first crawl")
+    run("sync: nothing changed")
+    # Touch 1% of the pages, as a few minutes of a busy contest would
+    titles = [title for pages in stub.books.values() for title in pages]
+    for title in titles[::100]:
+        stub.edit(title, 3, stub.users[0])
+    run("sync: 1% of pages edited")
+    run("sync: full re-scan", full=True)
+    return results
+
+
+def benchmark_endpoints(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    from sqlalchemy import event
+
+    from app import app
+    from extensions import db
+    from models import Contest, ContestUserScore
+    from response_cache import response_cache
+
+    # Measure the work behind a response, not the cache in front of it
+    response_cache.backend = None
+    client = app.test_client()
+    with app.app_context():
+        cid = db.session.scalar(db.select(Contest.cid).where(Contest.status.is_(True)).order_by(Contest.cid))
+        user_name = db.session.scalar(
+            db.select(ContestUserScore.user_name)
+            .where(ContestUserScore.contest_cid == cid)
+            .order_by(ContestUserScore.points.desc())
+        )
+        engine = db.engine
+
+    endpoints: Dict[str, str] = {
+        "GET /api/contests": "/api/contests",
+        "GET /api/contests?state=running&lang=en": "/api/contests?state=running&lang=en",
+        "GET /api/contest/<id>": f"/api/contest/{cid}",
+        "GET /api/contest/<id>/user/<name>/pages": f"/api/contest/{cid}/user/{user_name}/pages",
+        "GET /api/graph-data?contest=<id>": f"/api/graph-data?contest={cid}&start=2024-01-01&end=2024-03-01",
+        "GET /api/graph-data?group_by=user": "/api/graph-data?start=2024-01-01&end=2024-03-01&group_by=user",
+    }
+    queries = [0]
+
+    def count(*_: Any) -> None:
+        queries[0] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    results: Dict[str, Dict[str, float]] = {}
+    try:
+        for name, url in endpoints.items():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} answered {response.status_code}")
+            queries[0] = 0
+            durations: List[float] = []
+            for _ in range(args.repeat):
+                durations.append(timed(lambda: client.get(url))[0])
+            durations.sort()
+            results[name] = {
+                "seconds": statistics.median(durations),
+                "p95_seconds": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                "queries": queries[0] / args.repeat,
+                "bytes": len(response.data),
+            }
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]]) -> List[str]:
+    """Lines of the result table.
+
+    For endpoints, time is the median request and calls the SQL statements per
+    request; for the sync, time is the whole run and calls the API requests made.
+    """
+    header = f"{'benchmark':<45} {'time':>10} {'calls':>8}"
+    if baseline is not None:
+        header += f" {'baseline':>10} {'change':>8}"
+    lines = [header, "-" * len(header)]
+    for name, result in results.items():
+        line = f"{name:<45} {result['seconds'] * 1000:>8.1f}ms {result.get('queries', result.get('api_calls', 0)):>8.0f}"
+        if baseline is not None:
+            before = baseline.get(name)
+            if before is None:
+                line += f" {'-':>10} {'new':>8}"
+            else:
+                change = (result["seconds"] - before["seconds"]) / before["seconds"] if before["seconds"] else 0.0
+                flag = "  slower" if change > REGRESSION_THRESHOLD else ""
+                line += f" {before['seconds'] * 1000:>8.1f}ms {change:>+8.1%}{flag}"
+        lines.append(line)
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    # Must be set before the app is imported, which creates the engine
+    config["SQL_URI"] = args.db
+    config["RESPONSE_CACHE_BACKEND"] = "none"
+    config["JOB_WORKERS"] = 0
+    # Every run starts cold, like the first sync on a new host
+    config["PAGE_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="wscontest-bench-"), "page-cache.sqlite3")
+
+    from wiki_stub import StubWiki, make_server
+
+    stub = StubWiki(args.books, args.pages, args.users, args.seed)
+    server = make_server(stub, latency=args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config["WIKISOURCE_API_URL"] = f"http://127.0.0.1:{server.server_port}/{{lang}}/api.php"
+
+    from app import app
+    from extensions import db
+    from models import Contest
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        if db.session.scalar(db.select(Contest.cid).limit(1)) is not None:
+            sys.exit(f"{args.db} already holds contests, pass --reset to drop its tables")
+        create_contests(args)
+
+    results: Dict[str, Dict[str, float]] = {}
+    results.update(benchmark_sync(args, stub))
+    results.update(benchmark_endpoints(args))
+    server.shutdown()
+
+    baseline: Optional[Dict[str, Dict[str, float]]] = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    print("\n".join(compare(results, baseline)))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({
+                "scale": {
+                    key: getattr(args, key)
+                    for key in ("contests", "ended_contests", "books", "books_per_contest", "pages", "users", "seed", "latency")
+                },
+                "database": args.db.split(":", 1)[0],
+                "python": platform.python_version(),
+                "results": results,
+            }, f, indent=2)
+        print(f"Results saved to {args.save_baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import os
-from typing import Dict, Optional, Any
+import tempfile
+from typing import Dict, List, Optional, Any
 
 from dotenv import load_dotenv
 
@@ -23,13 +24,105 @@ APP_SECRET_KEY: Optional[str] = os.getenv("APP_SECRET_KEY")
 
 # Frontend URL configuration - updated for single server deployment
 FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:5000")
+
+# Wikisource sync configuration
+WIKISOURCE_API_URL: str = os.getenv("WIKISOURCE_API_URL") or "https://{lang}.wikisource.org/w/api.php"
+SYNC_CONCURRENCY: int = int(os.getenv("SYNC_CONCURRENCY") or 8)
+# Pages fetched, written and committed together by the sync
+SYNC_CHUNK_SIZE: int = int(os.getenv("SYNC_CHUNK_SIZE") or 500)
+# Per-wiki overrides, e.g. "en:4,bn:16"
+SYNC_CONCURRENCY_PER_WIKI: Dict[str, int] = {
+    lang.strip(): int(limit)
+    for lang, _, limit in (
+        item.partition(":") for item in os.getenv("SYNC_CONCURRENCY_PER_WIKI", "").split(",") if item.strip()
+    )
+}
+# Wikisource requests: maxlag sent with each (0 to leave out), seconds before giving up on a
+# response, attempts per request, and retries allowed as a fraction of all requests made
+SYNC_MAXLAG: int = int(os.getenv("SYNC_MAXLAG") or 5)
+SYNC_REQUEST_TIMEOUT: float = float(os.getenv("SYNC_REQUEST_TIMEOUT") or 30)
+SYNC_MAX_ATTEMPTS: int = int(os.getenv("SYNC_MAX_ATTEMPTS") or 5)
+SYNC_RETRY_BUDGET: float = float(os.getenv("SYNC_RETRY_BUDGET") or 0.1)
+# Wikis synced in parallel by db_update, each book once per wiki; 0 syncs contest by contest
+SYNC_WORKERS: int = int(os.getenv("SYNC_WORKERS") or 0)
+# sync_daemon.py: seconds between syncs of a contest that is active or close to its end, and of a quiet one
+SYNC_DAEMON_MIN_INTERVAL: int = int(os.getenv("SYNC_DAEMON_MIN_INTERVAL") or 180)
+SYNC_DAEMON_MAX_INTERVAL: int = int(os.getenv("SYNC_DAEMON_MAX_INTERVAL") or 3600)
+# Hours before the end of its last day from which a contest is always synced at the shortest interval
+SYNC_DAEMON_URGENT_HOURS: float = float(os.getenv("SYNC_DAEMON_URGENT_HOURS") or 24)
+# Seconds between checks for new, changed and removed contests
+SYNC_DAEMON_RESCAN_INTERVAL: int = int(os.getenv("SYNC_DAEMON_RESCAN_INTERVAL") or 60)
+# Page statuses kept on disk between syncs by (wiki, title, latest revid), 0 to disable
+PAGE_CACHE_SIZE: int = int(os.getenv("PAGE_CACHE_SIZE") or 500000)
+PAGE_CACHE_PATH: str = os.getenv("PAGE_CACHE_PATH") or os.path.join(tempfile.gettempdir(), "wscontest-page-cache.sqlite3")
+
+# Response cache for the contest read endpoints: "memory" (per worker), "file" (shared by workers) or "none"
+RESPONSE_CACHE_BACKEND: str = os.getenv("RESPONSE_CACHE_BACKEND") or "memory"
+RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE") or 256)
+RESPONSE_CACHE_DIR: str = os.getenv("RESPONSE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "wscontest-response-cache")
+
+# Threads per web worker running background jobs such as the first sync of a new contest, 0 to disable
+JOB_WORKERS: int = int(os.getenv("JOB_WORKERS") or 2)
+# Seconds after which a job still marked as running is taken for dead and failed
+JOB_TIMEOUT: int = int(os.getenv("JOB_TIMEOUT") or 7200)
+
+# Live leaderboard stream: seconds between checks for new data, and between keep-alive comments
+LIVE_POLL_INTERVAL: float = float(os.getenv("LIVE_POLL_INTERVAL") or 2)
+LIVE_HEARTBEAT: float = float(os.getenv("LIVE_HEARTBEAT") or 15)
+
+# Database connection pool; idle connections are recycled before MySQL's wait_timeout closes them
+DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE") or 5)
+DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW") or 10)
+DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT") or 30)
+DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE") or 280)
+DB_POOL_PRE_PING: bool = (os.getenv("DB_POOL_PRE_PING") or "true").lower() in ("1", "true", "yes")
+# Read replica for the public GET endpoints, unset to read from the primary
+DB_REPLICA_HOST: Optional[str] = os.getenv("DB_REPLICA_HOST") or None
+
+# Log requests slower than this many seconds with their SQL statements, 0 to disable
+METRICS_SLOW_REQUEST_SECONDS: float = float(os.getenv("METRICS_SLOW_REQUEST_SECONDS") or 0)
+# Comma-separated addresses or networks allowed to read /metrics and /api/pool-stats
+METRICS_ALLOWED_IPS: List[str] = [
+    value.strip() for value in (os.getenv("METRICS_ALLOWED_IPS") or "127.0.0.1,::1").split(",") if value.strip()
+]
+
 config: Dict[str, Any] = {
     "SQL_URI": f"mysql+pymysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_URL}:3306/{DB_NAME}",
+    "SQL_REPLICA_URI": f"mysql+pymysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_REPLICA_HOST}:3306/{DB_NAME}" if DB_REPLICA_HOST else None,
+    "DB_POOL_SIZE": DB_POOL_SIZE,
+    "DB_MAX_OVERFLOW": DB_MAX_OVERFLOW,
+    "DB_POOL_TIMEOUT": DB_POOL_TIMEOUT,
+    "DB_POOL_RECYCLE": DB_POOL_RECYCLE,
+    "DB_POOL_PRE_PING": DB_POOL_PRE_PING,
     "TIMEZONE": TIMEZONE,
     "CONSUMER_KEY": CONSUMER_KEY,
     "CONSUMER_SECRET": CONSUMER_SECRET,
     "OAUTH_MWURI": OAUTH_MWURI,
     "APP_SECRET_KEY" : APP_SECRET_KEY,
     "APP_NAME" : APP_NAME,
-    "FRONTEND_URL": FRONTEND_URL
+    "FRONTEND_URL": FRONTEND_URL,
+    "WIKISOURCE_API_URL": WIKISOURCE_API_URL,
+    "SYNC_CONCURRENCY": SYNC_CONCURRENCY,
+    "SYNC_CONCURRENCY_PER_WIKI": SYNC_CONCURRENCY_PER_WIKI,
+    "SYNC_CHUNK_SIZE": SYNC_CHUNK_SIZE,
+    "SYNC_MAXLAG": SYNC_MAXLAG,
+    "SYNC_REQUEST_TIMEOUT": SYNC_REQUEST_TIMEOUT,
+    "SYNC_MAX_ATTEMPTS": SYNC_MAX_ATTEMPTS,
+    "SYNC_RETRY_BUDGET": SYNC_RETRY_BUDGET,
+    "SYNC_WORKERS": SYNC_WORKERS,
+    "SYNC_DAEMON_MIN_INTERVAL": SYNC_DAEMON_MIN_INTERVAL,
+    "SYNC_DAEMON_MAX_INTERVAL": SYNC_DAEMON_MAX_INTERVAL,
+    "SYNC_DAEMON_URGENT_HOURS": SYNC_DAEMON_URGENT_HOURS,
+    "SYNC_DAEMON_RESCAN_INTERVAL": SYNC_DAEMON_RESCAN_INTERVAL,
+    "PAGE_CACHE_SIZE": PAGE_CACHE_SIZE,
+    "PAGE_CACHE_PATH": PAGE_CACHE_PATH,
+    "RESPONSE_CACHE_BACKEND": RESPONSE_CACHE_BACKEND,
+    "RESPONSE_CACHE_SIZE": RESPONSE_CACHE_SIZE,
+    "RESPONSE_CACHE_DIR": RESPONSE_CACHE_DIR,
+    "JOB_WORKERS": JOB_WORKERS,
+    "JOB_TIMEOUT": JOB_TIMEOUT,
+    "LIVE_POLL_INTERVAL": LIVE_POLL_INTERVAL,
+    "LIVE_HEARTBEAT": LIVE_HEARTBEAT,
+    "METRICS_SLOW_REQUEST_SECONDS": METRICS_SLOW_REQUEST_SECONDS,
+    "METRICS_ALLOWED_IPS": METRICS_ALLOWED_IPS,
 }
@@ -0,0 +1,298 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+import zlib
+
+import datetime as dt
+from dateutil import parser
+
+from config import config
+from extensions import db
+from models import Book, Contest
+from response_cache import bump_generation
+from sync_store import (
+    UserCache,
+    book_watermarks,
+    has_scores,
+    load_watermarks,
+    new_checkpoint,
+    refresh_rollups,
+    refresh_scores,
+    save_checkpoint,
+    save_watermark,
+    upsert_index_pages,
+)
+from sync_stats import BookStats, SyncStats
+from ws_client import WikiClient
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT: str = "IndicWikisourceContest/1.1 (Development; https://example.org/IndicWikisourceContest/;) pywikisource/0.0.5"
+
+
+def sync_book(
+    ws: WikiClient,
+    contest: Contest,
+    book_name: str,
+    watermark: Optional[int],
+    checkpoint: Dict[str, Any],
+    users: UserCache,
+    page_list: Optional[List[str]] = None,
+    stats: Optional[BookStats] = None,
+    sharing: Sequence[int] = (),
+) -> None:
+    """Sync one book of a contest, committing every ``SYNC_CHUNK_SIZE`` pages.
+
+    Progress is recorded in ``checkpoint`` with each commit so an interrupted
+    run picks up at the first page that was not committed yet. Cached
+    responses are invalidated once, with the last commit of the book. ``page_list``
+    can be passed in when the pages of the index were already fetched.
+    ``sharing`` lists other contests the book is synced for in the same pass;
+    their members and watermarks are updated along with those of ``contest``.
+    """
+    contest_cid, contest_name = contest.cid, contest.name
+    contest_cids: List[int] = [contest_cid, *sharing]
+    stats = stats or BookStats(contest_cid, book_name)
+    if page_list is None:
+        page_list = ws.createdPageList(book_name)
+    logger.info("Found %d pages for book %s", len(page_list), book_name)
+    if checkpoint["page_count"] != len(page_list):
+        # Pages were added or removed since the checkpoint, offsets are meaningless
+        checkpoint.update(pages_done=0, page_count=len(page_list), max_revid=None, min_failed_revid=None)
+    elif checkpoint["pages_done"]:
+        logger.info("Resuming book %s at page %d", book_name, checkpoint["pages_done"])
+    # Pages before the checkpoint may have been edited since the interruption, and revision
+    # ids only grow, so a resumed run keeps max_revid where it stopped to leave those edits
+    # above the watermark for the next run
+    resumed: bool = checkpoint["pages_done"] > 0
+    # Edits made while the book is scanned get revision ids above the newest one of the wiki
+    # now; capping max_revid here keeps those on pages already scanned above the watermark
+    high_water: Optional[int] = ws.latest_revid() if page_list and not resumed else None
+
+    chunk_size: int = config["SYNC_CHUNK_SIZE"]
+    for start in range(checkpoint["pages_done"], len(page_list), chunk_size):
+        chunk: List[str] = page_list[start:start + chunk_size]
+        latest = ws.latest_revisions(chunk)
+        changed: List[str] = [
+            page for page in chunk
+            if latest[page] is not None and (watermark is None or latest[page]["revid"] > watermark)
+        ]
+        logger.info(
+            "%d of pages %d-%d of %s changed since revision %s",
+            len(changed), start + 1, start + len(chunk), book_name, watermark,
+        )
+        statuses: Dict[str, Any] = ws.batch_statuses(changed, latest)
+        rows: List[Dict[str, Any]] = []
+
+        for page in changed:
+            response: Dict[str, Any] = statuses[page]
+            logger.debug("Page status of %s: %s", page, response)
+            if not response:
+                logger.warning("Skipping page %s, status could not be fetched", page)
+                stats.failed_pages += 1
+                failed: Optional[int] = checkpoint["min_failed_revid"]
+                checkpoint["min_failed_revid"] = min(filter(None, [failed, latest[page]["revid"]]))
+                continue
+            row: Dict[str, Any] = {
+                "book_name": book_name,
+                "page_name": page,
+                "proofreader_username": None,
+                "proofread_time": None,
+                "p_revision_id": None,
+                "validator_username": None,
+                "validate_time": None,
+                "v_revision_id": None,
+            }
+
+            if response['proofread'] is not None:
+                for cid in contest_cids:
+                    users.add(cid, response["proofread"]["user"])
+                row["proofreader_username"] = response["proofread"]["user"]
+                proofread_time: dt.datetime = parser.parse(response["proofread"]["timestamp"])
+                row["proofread_time"] = proofread_time.replace(tzinfo=None)
+                row["p_revision_id"] = response["proofread"]["revid"]
+
+            if response['validate'] is not None:
+                for cid in contest_cids:
+                    users.add(cid, response["validate"]["user"])
+                row["validator_username"] = response["validate"]["user"]
+                validate_time: dt.datetime = parser.parse(response["validate"]["timestamp"])
+                row["validate_time"] = validate_time.replace(tzinfo=None)
+                row["v_revision_id"] = response["validate"]["revid"]
+
+            rows.append(row)
+
+        # Users must exist before pages referencing them are written
+        new_users, new_members = users.flush()
+        logger.info("%d users created and %d added to contest %s", new_users, new_members, contest_name)
+        inserted, updated, touched_users = upsert_index_pages(book_name, rows)
+        logger.info("%d pages inserted and %d updated for book %s", inserted, updated, book_name)
+        stats.pages += len(chunk)
+        stats.changed_pages += len(changed)
+        stats.inserted += inserted
+        stats.updated += updated
+        # Other running contests with this book see the change too, and their own sync will
+        # not since the rows are already written by then; ended contests keep their results
+        for sharing_contest in db.session.get(Book, book_name).contests:
+            if sharing_contest.cid not in contest_cids and not sharing_contest.status:
+                continue
+            refresh_scores(sharing_contest, touched_users)
+            refresh_rollups(sharing_contest, touched_users)
+
+        if not resumed:
+            revids: List[int] = [info["revid"] for info in latest.values() if info is not None]
+            seen: Optional[int] = max(filter(None, [checkpoint["max_revid"], *revids]), default=None)
+            checkpoint["max_revid"] = None if seen is None or high_water is None else min(seen, high_water)
+        checkpoint["pages_done"] = start + len(chunk)
+        save_checkpoint(contest_cid, book_name, checkpoint)
+        db.session.commit()
+
+    # Never move the watermark past a page that could not be fetched
+    new_watermark: Optional[int] = checkpoint["max_revid"] if checkpoint["max_revid"] is not None else watermark
+    if resumed and checkpoint["max_revid"] is None:
+        # Nothing before the interruption bounds the revision ids of the edits made since
+        new_watermark = watermark
+    elif checkpoint["min_failed_revid"] is not None:
+        failed_below: int = checkpoint["min_failed_revid"] - 1
+        new_watermark = failed_below if new_watermark is None else min(new_watermark, failed_below)
+    if watermark is not None and (new_watermark is None or new_watermark < watermark):
+        new_watermark = watermark
+    for cid in contest_cids:
+        save_watermark(cid, book_name, new_watermark)
+    checkpoint["completed"] = True
+    save_checkpoint(contest_cid, book_name, checkpoint)
+    # Once per book, parallel workers would all wait on the one generation row if it were per chunk
+    if stats.inserted or stats.updated:
+        bump_generation()
+    db.session.commit()
+
+
+def book_failed(book_stats: BookStats) -> None:
+    """Roll back a failed book, invalidating cached responses if chunks of it were committed"""
+    db.session.rollback()
+    if book_stats.inserted or book_stats.updated:
+        try:
+            bump_generation()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning("Could not invalidate cached responses after book %s: %s", book_stats.book_name, e)
+
+
+def sync_contest(
+    ws: WikiClient,
+    contest: Contest,
+    users: UserCache,
+    checkpoints: Dict[Tuple[int, str], Dict[str, Any]],
+    full: bool = False,
+    page_lists: Optional[Dict[str, Optional[List[str]]]] = None,
+    on_book: Optional[Callable[[str], None]] = None,
+    stats: Optional[SyncStats] = None,
+) -> None:
+    """Sync every book of a running contest and make sure it has a leaderboard.
+
+    A failing book is logged and skipped so the other books still get synced.
+    ``on_book`` is called with the name of every book once it is done.
+    """
+    stats = stats or SyncStats()
+    book_names: List[str] = [book.name for book in contest.books]
+    logger.info("Found %d books for contest %s", len(book_names), contest.name)
+    watermarks: Dict[str, Optional[int]] = {} if full else load_watermarks(contest.cid)
+    page_lists = page_lists or {}
+
+    for book_name in book_names:
+        checkpoint: Dict[str, Any] = checkpoints.get((contest.cid, book_name), new_checkpoint())
+        if checkpoint["completed"]:
+            logger.info("Skipping book %s, already synced before the interruption", book_name)
+        else:
+            logger.info("Processing book: %s", book_name)
+            with stats.book(contest.cid, book_name) as book_stats:
+                try:
+                    sync_book(
+                        ws, contest, book_name, watermarks.get(book_name), checkpoint, users,
+                        page_lists.get(book_name), book_stats,
+                    )
+                except Exception as e:
+                    book_failed(book_stats)
+                    stats.errors += 1
+                    logger.error("Error in %s contest, book %s: %s", contest.name, book_name, e)
+        if on_book is not None:
+            on_book(book_name)
+
+    ensure_leaderboard(contest, full)
+
+
+def ensure_leaderboard(contest: Contest, full: bool = False) -> None:
+    """Rebuild the leaderboard and graphs of a contest that has none yet, or always when ``full``"""
+    if full or not has_scores(contest.cid):
+        logger.info("Rebuilding leaderboard and graphs of contest %s", contest.name)
+        refresh_scores(contest)
+        refresh_rollups(contest)
+        bump_generation()
+        db.session.commit()
+
+
+@dataclass
+class BookTask:
+    """A book of a wiki, synced once for all the running contests that include it"""
+
+    lang: str
+    book_name: str
+    # In ascending order; the first contest holds the checkpoint
+    contest_cids: List[int] = field(default_factory=list)
+
+
+def in_shard(key: str, shard: Optional[Tuple[int, int]]) -> bool:
+    """Whether ``key`` belongs to shard ``(index, count)``, the same on every host"""
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(key.encode("utf-8")) % count == index
+
+
+def plan_books(contests: List[Contest], shard: Optional[Tuple[int, int]] = None) -> Dict[str, List[BookTask]]:
+    """Books of ``contests`` in ``shard``, grouped by wiki with every book listed once per wiki"""
+    tasks: Dict[Tuple[str, str], BookTask] = {}
+    for contest in sorted(contests, key=lambda contest: contest.cid):
+        for book in contest.books:
+            if in_shard(f"{contest.lang}:{book.name}", shard):
+                task = tasks.setdefault((contest.lang, book.name), BookTask(contest.lang, book.name))
+                task.contest_cids.append(contest.cid)
+    groups: Dict[str, List[BookTask]] = {}
+    for task in tasks.values():
+        groups.setdefault(task.lang, []).append(task)
+    return groups
+
+
+def sync_shared_book(
+    ws: WikiClient,
+    task: BookTask,
+    users: UserCache,
+    checkpoints: Dict[Tuple[int, str], Dict[str, Any]],
+    full: bool = False,
+    stats: Optional[SyncStats] = None,
+) -> None:
+    """Sync a book once for every contest of ``task``.
+
+    Pages edited since the oldest watermark among those contests are fetched.
+    A failure is logged and rolled back so the other books still get synced.
+    """
+    stats = stats or SyncStats()
+    owner: Contest = db.session.get(Contest, task.contest_cids[0])
+    checkpoint: Dict[str, Any] = checkpoints.get((owner.cid, task.book_name), new_checkpoint())
+    if checkpoint["completed"]:
+        logger.info("Skipping book %s, already synced before the interruption", task.book_name)
+        return
+    watermark: Optional[int] = None
+    if not full:
+        watermarks = book_watermarks(task.book_name, task.contest_cids)
+        if all(watermarks.get(cid) is not None for cid in task.contest_cids):
+            watermark = min(watermarks.values())
+    logger.info("Processing book %s of %s for contests %s", task.book_name, task.lang, task.contest_cids)
+    with stats.book(owner.cid, task.book_name, task.lang) as book_stats:
+        try:
+            sync_book(ws, owner, task.book_name, watermark, checkpoint, users, stats=book_stats, sharing=task.contest_cids[1:])
+        except Exception as e:
+            book_failed(book_stats)
+            stats.errors += 1
+            logger.error("Error in book %s of %s: %s", task.book_name, task.lang, e)
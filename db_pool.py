@@ -0,0 +1,131 @@
+"""Connection pool settings, pool wait statistics and read-replica routing.
+
+Views decorated with ``read_replica`` run their queries on the ``replica``
+bind when one is configured; everything else, including the sync and all
+writes, stays on the primary.
+"""
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+import threading
+import time
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select
+from sqlalchemy.pool import QueuePool
+
+from config import config
+
+REPLICA_BIND: str = "replica"
+
+
+class PoolStats:
+    """Time spent waiting for a connection to be checked out of a pool"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checkouts: int = 0
+        self.wait_total: float = 0.0
+        self.wait_max: float = 0.0
+
+    def record(self, wait: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_total_seconds": round(self.wait_total, 6),
+                "wait_avg_seconds": round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0,
+                "wait_max_seconds": round(self.wait_max, 6),
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long every checkout waited for a free connection"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats: PoolStats = PoolStats()
+
+    def recreate(self) -> "TimedQueuePool":
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.stats.record(time.perf_counter() - start)
+
+
+def engine_options(uri: str) -> Dict[str, Any]:
+    """Engine options for ``uri``; SQLite (local runs and benchmarks) keeps SQLAlchemy's defaults"""
+    if uri.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        # Reconnect before MySQL's wait_timeout drops idle connections
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+
+
+def binds() -> Dict[str, Dict[str, Any]]:
+    """Value of ``SQLALCHEMY_BINDS``"""
+    uri: Optional[str] = config["SQL_REPLICA_URI"]
+    if not uri:
+        return {}
+    return {REPLICA_BIND: {"url": uri, **engine_options(uri)}}
+
+
+class RoutingSession(Session):
+    """Sends plain SELECTs of ``read_replica`` views to the replica"""
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, bind: Any = None, **kwargs: Any) -> Any:
+        if (
+            bind is None
+            and not self._flushing
+            and isinstance(clause, Select)
+            and has_app_context()
+            and g.get("read_replica", False)
+            and REPLICA_BIND in self._db.engines
+        ):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_replica(view: Callable[..., Any]) -> Callable[..., Any]:
+    """Run the queries of a read-only view on the replica, if one is configured"""
+
+    @wraps(view)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        g.read_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.read_replica = False
+
+    return wrapper
+
+
+def pool_stats(engines: Dict[Optional[str], Any]) -> Dict[str, Dict[str, Any]]:
+    """Size, usage and checkout wait of the pool of every engine"""
+    result: Dict[str, Dict[str, Any]] = {}
+    for key, engine in engines.items():
+        pool = engine.pool
+        stats: Dict[str, Any] = {"pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        if isinstance(pool, TimedQueuePool):
+            stats.update(pool.stats.as_dict())
+        result[key or "primary"] = stats
+    return result
@@ -1,14 +1,24 @@
-from typing import Dict, List, Optional, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Optional, Set, Tuple
+import argparse
+import cProfile
 import logging
+import pstats
 import sys
 
-from pywikisource import WikiSourceApi
 import datetime as dt
-from pytz import timezone
-from models import Contest, Book, IndexPage, User
-from dateutil import parser
+from models import Contest
 from extensions import db 
 from app import app 
+from config import config
+from contest_sync import USER_AGENT, BookTask, ensure_leaderboard, in_shard, plan_books, sync_contest, sync_shared_book
+from ws_client import WikiClient
+from response_cache import bump_generation
+from rate_control import rate_control_stats
+from jobs import contests_with_running_jobs, fail_stale_jobs
+import traffic
+from sync_stats import SyncStats
+from sync_store import UserCache, clear_checkpoints, contest_window, load_checkpoints
 
 # Configure logging
 logging.basicConfig(
@@ -21,95 +31,219 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__) 
 
-def run() -> None:
+def parse_shard(value: str) -> Tuple[int, int]:
+    """``--shard`` value ``i/n``, with ``i`` counted from 0"""
+    index, _, count = value.partition("/")
+    try:
+        shard = (int(index), int(count))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not of the form i/n")
+    if not 0 <= shard[0] < shard[1]:
+        raise argparse.ArgumentTypeError(f"{value}: i must be between 0 and n - 1")
+    return shard
+
+
+def sync_wiki(
+    lang: str,
+    tasks: List[BookTask],
+    checkpoints: Dict[Tuple[int, str], Dict[str, Any]],
+    full: bool,
+    stats: SyncStats,
+) -> None:
+    """Sync the books of one wiki with one client, in an app context and database session of its own"""
+    with app.app_context():
+        ws: WikiClient = WikiClient(lang, USER_AGENT)
+        ws.on_request = stats.recorder()
+        ws.on_cache = stats.cache_recorder()
+        users: UserCache = UserCache({cid for task in tasks for cid in task.contest_cids})
+        with stats.wiki(lang):
+            for task in tasks:
+                sync_shared_book(ws, task, users, checkpoints, full=full, stats=stats)
+
+
+def run(
+    full: bool = False,
+    restart: bool = False,
+    stats_file: Optional[str] = None,
+    profile_contest: Optional[int] = None,
+    profile_file: Optional[str] = None,
+    workers: Optional[int] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    replay_latency: bool = False,
+) -> SyncStats:
+    """Sync page statuses of all running contests.
+
+    Only pages edited since the per contest and book watermark are fetched,
+    unless ``full`` is set, in which case every page is re-scanned. A run that
+    was interrupted is resumed from its checkpoints unless ``restart`` is set.
+    Timings per contest and book are written to ``stats_file`` as JSON, and the
+    sync of contest ``profile_contest`` runs under cProfile.
+
+    With ``workers`` (``SYNC_WORKERS`` by default) or ``shard`` set, books are
+    grouped by wiki instead, each book is synced once for all the contests that
+    include it, and up to ``workers`` wikis are synced in parallel. ``shard``
+    ``(i, n)`` limits the run to the books, and leaderboards, of shard ``i``
+    out of ``n``, so ``n`` hosts can split the work.
+
+    Wikisource responses are saved to the file ``record``, or answered from
+    the recording ``replay`` without touching the network, after their
+    recorded latency if ``replay_latency`` is set (see ``traffic.py``).
+    """
     logger.info("Starting db_update script...")
+    workers = config["SYNC_WORKERS"] if workers is None else workers
+    stats: SyncStats = SyncStats()
+    transport: Optional[traffic.Transport] = None
+    if record:
+        transport = traffic.Recorder(record)
+    elif replay:
+        transport = traffic.Replayer(replay, latency=replay_latency)
+    traffic.install(transport)
+    try:
+        _run(stats, full, restart, profile_contest, profile_file, workers, shard)
+    finally:
+        traffic.install(None)
+        if transport is not None:
+            transport.close()
+    if stats_file:
+        stats.write(stats_file)
+    return stats
+
+
+def _run(
+    stats: SyncStats,
+    full: bool,
+    restart: bool,
+    profile_contest: Optional[int],
+    profile_file: Optional[str],
+    workers: int,
+    shard: Optional[Tuple[int, int]],
+) -> None:
+    by_wiki: bool = workers > 0 or shard is not None
     with app.app_context():  
         logger.info("Application context established")
+        stats.attach(db.engine)
         contests: List[Contest] = Contest.query.all()
         logger.info(f"Found {len(contests)} contests in database")
-        user_agent: str = "IndicWikisourceContest/1.1 (Development; https://example.org/IndicWikisourceContest/;) pywikisource/0.0.5"
-
+        fail_stale_jobs()
+        # A contest whose first sync is still running as a job is left to it, checkpoints included
+        busy: Set[int] = contests_with_running_jobs()
+        running: List[Contest] = []
         for contest in contests:
-            logger.info(f"Processing contest: {contest.name} (ID: {contest.cid})")
-            if dt.datetime.today() > contest.end_date:
+            # Edits of the whole last day count, as in the scores
+            if dt.datetime.now() >= contest_window(contest)[1]:
                 contest.status = False
                 logger.info(f"Contest {contest.name} has ended, setting status to False")
-            if contest.status == False:
-                logger.info(f"Skipping contest {contest.name} - status is False")
-                continue 
+            if contest.status == True and contest.cid in busy:
+                logger.info(f"Skipping contest {contest.name} - its setup job is syncing it")
             elif contest.status == True:
-                logger.info(f"Processing active contest: {contest.name}")
-                ws: WikiSourceApi = WikiSourceApi(contest.lang, user_agent)
+                running.append(contest)
+            else:
+                logger.info(f"Skipping contest {contest.name} - status is False")
 
-                books: List[Book] = contest.books
-                logger.info(f"Found {len(books)} books for contest {contest.name}")
+        groups: Dict[str, List[BookTask]] = plan_books(running, shard) if by_wiki else {}
+        # Checkpoints of the books of other shards belong to the runs of those shards
+        shard_books: Optional[Set[str]] = (
+            {task.book_name for tasks in groups.values() for task in tasks} if shard is not None else None
+        )
+        if restart:
+            clear_checkpoints(book_names=shard_books, skip_contests=busy)
+        checkpoints: Dict[Tuple[int, str], Dict[str, Any]] = {
+            key: checkpoint for key, checkpoint in load_checkpoints().items() if key[0] not in busy
+        }
+        if checkpoints:
+            logger.info(f"Resuming interrupted sync from {len(checkpoints)} checkpoints")
 
-                for book in books:
-                    logger.info(f"Processing book: {book.name}")
+        if by_wiki:
+            if profile_contest is not None:
+                logger.warning("Profiling a contest is only supported when syncing contest by contest")
+            logger.info(
+                "Syncing %d books of %d wikis with %d workers",
+                sum(len(tasks) for tasks in groups.values()), len(groups), max(workers, 1),
+            )
+            # Workers must not wait on the locks of this session
+            db.session.commit()
+            with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="sync") as pool:
+                futures = {
+                    pool.submit(sync_wiki, lang, tasks, checkpoints, full, stats): lang
+                    # Biggest wikis first so they do not end up last on a worker
+                    for lang, tasks in sorted(groups.items(), key=lambda item: -len(item[1]))
+                }
+                for future in as_completed(futures):
                     try:
-                        page_list: List[str] = ws.createdPageList(book.name)
-                        logger.info(f"Found {len(page_list)} pages for book {book.name}")
-
-                        for page in page_list:
-                            logger.debug(f"Processing page: {page}")
-                            ipage: IndexPage = IndexPage(book_name=book.name, page_name=page)
-                            response: Dict[str, Any] = ws.pageStatus(page)
-                            logger.debug(f"Page status response: {response}")
-
-                            if response['proofread'] is not None:
-                                logger.debug(f"Processing proofread data for user: {response['proofread']['user']}")
-                                user: Optional[User] = User.query.filter_by(user_name=response["proofread"]["user"]).first()
-                                if not user:
-                                    logger.info(f"Creating new user: {response['proofread']['user']}")
-                                    user = User(user_name=response["proofread"]["user"])
-                                    db.session.add(user)
-                                else:
-                                    logger.debug(f"Found existing user: {user.user_name}")
-                                # Add user to contest if not already in it
-                                if contest not in user.contests:
-                                    logger.info(f"Adding user {user.user_name} to contest {contest.name}")
-                                    user.contests.append(contest)
-                                else:
-                                    logger.debug(f"User {user.user_name} already in contest {contest.name}")
-                                ipage.proofreader_username = user.user_name
-                                proofread_time: dt.datetime = parser.parse(response["proofread"]["timestamp"])
-                                ipage.proofread_time = proofread_time.strftime('%Y-%m-%d %H:%M:%S')
-                                ipage.p_revision_id = response["proofread"]["revid"]
-
-                            if response['validate'] is not None:
-                                logger.debug(f"Processing validate data for user: {response['validate']['user']}")
-                                user: Optional[User] = User.query.filter_by(user_name=response["validate"]["user"]).first()
-                                if not user:
-                                    logger.info(f"Creating new user: {response['validate']['user']}")
-                                    user = User(user_name=response["validate"]["user"])
-                                    db.session.add(user)
-                                else:
-                                    logger.debug(f"Found existing user: {user.user_name}")
-                                # Add user to contest if not already in it
-                                if contest not in user.contests:
-                                    logger.info(f"Adding user {user.user_name} to contest {contest.name}")
-                                    user.contests.append(contest)
-                                else:
-                                    logger.debug(f"User {user.user_name} already in contest {contest.name}")
-                                ipage.validator_username = user.user_name
-                                validate_time: dt.datetime = parser.parse(response["validate"]["timestamp"])
-                                ipage.validate_time = validate_time.strftime('%Y-%m-%d %H:%M:%S')
-                                ipage.v_revision_id = response["validate"]["revid"]
-
-                            logger.debug(f"Adding IndexPage to session: {ipage.page_name}")
-                            db.session.add(ipage)
-
+                        future.result()
                     except Exception as e:
-                        logger.error(f"Error in {contest.name} contest, book {book.name}: {e}")
+                        stats.errors += 1
+                        logger.error("Error syncing wiki %s: %s", futures[future], e)
+            for contest in running:
+                if in_shard(f"contest:{contest.cid}", shard):
+                    ensure_leaderboard(contest, full)
+        else:
+            users: UserCache = UserCache(contest.cid for contest in running)
+            for contest in running:
+                logger.info(f"Processing active contest: {contest.name} (ID: {contest.cid})")
+                ws: WikiClient = WikiClient(contest.lang, USER_AGENT)
+                ws.on_request = stats.recorder()
+                ws.on_cache = stats.cache_recorder()
+                profiler: Optional[cProfile.Profile] = cProfile.Profile() if contest.cid == profile_contest else None
+                with stats.contest(contest.cid, contest.name):
+                    if profiler is not None:
+                        profiler.enable()
+                    try:
+                        sync_contest(ws, contest, users, checkpoints, full=full, stats=stats)
+                    finally:
+                        if profiler is not None:
+                            profiler.disable()
+                if profiler is not None:
+                    path = profile_file or f"db_update_contest_{contest.cid}.prof"
+                    profiler.dump_stats(path)
+                    logger.info("Profile of contest %s written to %s", contest.name, path)
+                    pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(20)
 
         logger.info("Committing all changes to database...")
+        clear_checkpoints(completed_only=True, book_names=shard_books, skip_contests=busy)
+        bump_generation()
         db.session.commit()
+        stats.detach()
+        stats.rate_control = rate_control_stats()
         logger.info("Database update completed successfully!")
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Sync contest page statuses from Wikisource")
+    arg_parser.add_argument("--full", action="store_true", help="re-scan every page instead of only changed ones")
+    arg_parser.add_argument("--restart", action="store_true", help="ignore checkpoints left by an interrupted run")
+    arg_parser.add_argument("--stats-file", default="db_update_stats.json", help="where to write the JSON timing summary")
+    arg_parser.add_argument("--profile-contest", type=int, metavar="ID", help="run the sync of this contest under cProfile")
+    arg_parser.add_argument("--profile-file", help="where to write the profile, db_update_contest_<ID>.prof by default")
+    arg_parser.add_argument(
+        "--workers", type=int, metavar="N",
+        help="sync each book once per wiki, N wikis in parallel (SYNC_WORKERS by default, 0 syncs contest by contest)",
+    )
+    arg_parser.add_argument(
+        "--shard", type=parse_shard, metavar="i/n",
+        help="only sync the books of shard i (from 0) out of n, to split the work across hosts",
+    )
+    traffic_group = arg_parser.add_mutually_exclusive_group()
+    traffic_group.add_argument("--record", metavar="FILE", help="save every Wikisource response to FILE (.jsonl.gz)")
+    traffic_group.add_argument("--replay", metavar="FILE", help="answer Wikisource requests from a recording instead of the network")
+    arg_parser.add_argument("--replay-latency", action="store_true", help="with --replay, wait as long as each recorded response took")
+    args = arg_parser.parse_args()
+
     logger.info("=== WikiSource Contest Database Update Script ===")
     try:
-        run()
+        run(
+            full=args.full,
+            restart=args.restart,
+            stats_file=args.stats_file,
+            profile_contest=args.profile_contest,
+            profile_file=args.profile_file,
+            workers=args.workers,
+            shard=args.shard,
+            record=args.record,
+            replay=args.replay,
+            replay_latency=args.replay_latency,
+        )
     except Exception as e:
         logger.error(f"Script failed with error: {e}")
         import traceback
@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
-db: SQLAlchemy = SQLAlchemy()
+from db_pool import RoutingSession
+
+db: SQLAlchemy = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate: Migrate = Migrate() 
\ No newline at end of file
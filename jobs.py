@@ -0,0 +1,205 @@
+"""Background jobs of the web app, tracked in the ``job`` table.
+
+Jobs are queued in the same transaction as the change that needs them and run
+on a small thread pool inside the worker that queued them, so there is no
+broker to operate. With ``JOB_WORKERS=0`` nothing runs in-process and queued
+jobs are left to ``flask --app app run-jobs``.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import datetime as dt
+import json
+import logging
+
+from flask import Flask
+from sqlalchemy import select, update
+
+from config import config
+from contest_sync import USER_AGENT, sync_contest
+from extensions import db
+from models import Contest, Job
+from sync_store import UserCache, clear_checkpoints
+from ws_client import InvalidIndexError, WikiClient
+
+logger = logging.getLogger(__name__)
+
+
+def prefetch_page_lists(ws: WikiClient, book_names: List[str]) -> Tuple[Dict[str, Optional[List[str]]], Dict[str, str]]:
+    """Pages of every index, fetched concurrently; ``None`` where the request failed.
+
+    Indexes the wiki refuses are returned apart with the reason, and listed
+    with no pages so the sync does not ask for them again.
+    """
+    invalid: Dict[str, str] = {}
+
+    def fetch(book_name: str) -> Optional[List[str]]:
+        try:
+            return ws.index_pages(book_name)
+        except InvalidIndexError as e:
+            logger.warning("Index:%s is not a valid index: %s", book_name, e)
+            invalid[book_name] = str(e)
+            return []
+        except Exception as e:
+            logger.warning("Could not fetch the pages of %s: %s", book_name, e)
+            return None
+
+    if not book_names:
+        return {}, invalid
+    with ThreadPoolExecutor(max_workers=ws.concurrency, thread_name_prefix=f"prefetch-{ws.lang}") as pool:
+        return dict(zip(book_names, pool.map(fetch, book_names))), invalid
+
+
+def setup_contest(job: Job) -> Dict[str, Any]:
+    """Validate the books of a new contest and run its first sync"""
+    contest: Optional[Contest] = db.session.get(Contest, job.contest_cid)
+    if contest is None:
+        raise ValueError(f"Contest {job.contest_cid} does not exist")
+    ws: WikiClient = WikiClient(contest.lang, USER_AGENT)
+    book_names: List[str] = [book.name for book in contest.books]
+    page_lists, invalid = prefetch_page_lists(ws, book_names)
+    job.total = len(book_names)
+    db.session.commit()
+
+    def book_done(book_name: str) -> None:
+        job.progress += 1
+        db.session.commit()
+
+    sync_contest(ws, contest, UserCache([contest.cid]), {}, page_lists=page_lists, on_book=book_done)
+    # The cron sync must not mistake these for checkpoints of an interrupted run once the job is over
+    clear_checkpoints(contest_cid=contest.cid)
+    db.session.commit()
+    return {
+        "pages": sum(len(pages) for pages in page_lists.values() if pages),
+        "empty_books": [name for name, pages in page_lists.items() if pages == [] and name not in invalid],
+        "invalid_books": [{"book": name, "message": message} for name, message in sorted(invalid.items())],
+        "unreachable_books": [name for name, pages in page_lists.items() if pages is None],
+    }
+
+
+HANDLERS: Dict[str, Callable[[Job], Dict[str, Any]]] = {
+    "setup_contest": setup_contest,
+}
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "contest_id": job.contest_cid,
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.total,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class JobQueue:
+    """Queues jobs in the database and runs them on a per-worker thread pool"""
+
+    def __init__(self) -> None:
+        self.app: Optional[Flask] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+        workers: int = app.config.get("JOB_WORKERS", 2)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job") if workers > 0 else None
+
+    def enqueue(self, kind: str, contest_cid: Optional[int] = None) -> Job:
+        """Add a job to the session; it is started by ``start`` once the caller committed"""
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind {kind!r}")
+        job = Job(kind=kind, contest_cid=contest_cid, status="queued", progress=0)
+        db.session.add(job)
+        db.session.flush()
+        return job
+
+    def start(self, job_id: int) -> None:
+        if self._pool is not None:
+            self._pool.submit(self._run_in_context, job_id)
+
+    def _run_in_context(self, job_id: int) -> None:
+        with self.app.app_context():
+            run_job(job_id)
+
+
+def run_job(job_id: int) -> bool:
+    """Run a queued job, returns False if another worker claimed it first"""
+    # Claiming with a conditional UPDATE keeps two runners from picking the same job
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id)
+        .where(Job.status == "queued")
+        .values(status="running", started_at=dt.datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return False
+    job: Job = db.session.get(Job, job_id)
+    logger.info("Running job %s (%s)", job.id, job.kind)
+    try:
+        result = HANDLERS[job.kind](job)
+        job.status = "done"
+        job.result = json.dumps(result)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Job %s failed", job_id)
+        job = db.session.get(Job, job_id)
+        job.status = "failed"
+        job.error = str(e)
+    job.finished_at = dt.datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+def stale_before() -> dt.datetime:
+    """Jobs started before this and still running are taken for dead"""
+    return dt.datetime.utcnow() - dt.timedelta(seconds=config["JOB_TIMEOUT"])
+
+
+def fail_stale_jobs() -> int:
+    """Fail the jobs that have been running for over ``JOB_TIMEOUT``, returns how many.
+
+    Their worker most likely died mid-job; the sync picks their contests up
+    again, resuming from the checkpoints the job left.
+    """
+    failed = db.session.execute(
+        update(Job)
+        .where(Job.status == "running")
+        .where(Job.started_at < stale_before())
+        .values(
+            status="failed",
+            error=f"Still running after {config['JOB_TIMEOUT']}s, its worker probably stopped",
+            finished_at=dt.datetime.utcnow(),
+        )
+    ).rowcount
+    db.session.commit()
+    if failed:
+        logger.warning("%d jobs ran for over %ds and were marked as failed", failed, config["JOB_TIMEOUT"])
+    return failed
+
+
+def contests_with_running_jobs() -> Set[int]:
+    """Contests a live job is syncing; other syncs leave them, and their checkpoints, to it"""
+    return set(db.session.scalars(
+        select(Job.contest_cid)
+        .where(Job.status == "running")
+        .where(Job.started_at >= stale_before())
+        .where(Job.contest_cid.is_not(None))
+    ))
+
+
+def run_pending() -> int:
+    """Fail stale jobs, then run every queued job in this process; returns how many ran"""
+    fail_stale_jobs()
+    count = 0
+    for job_id in list(db.session.scalars(select(Job.id).where(Job.status == "queued").order_by(Job.id))):
+        count += run_job(job_id)
+    return count
+
+
+job_queue: JobQueue = JobQueue()
@@ -0,0 +1,179 @@
+"""Server-Sent Events stream of contest leaderboards.
+
+One broadcaster thread per worker watches the data generation counter. When
+it moves, the leaderboard of every contest somebody is listening to is loaded
+once and only the rows that changed are pushed to that contest's clients.
+A client gets the whole leaderboard as a snapshot when it connects.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+import json
+import logging
+import queue
+import threading
+import time
+
+from flask import Flask, g
+from sqlalchemy import select
+
+from extensions import db
+from models import ContestUserScore
+from response_cache import current_generation
+
+logger = logging.getLogger(__name__)
+
+# user name -> proofread_count, validated_count, points
+Board = Dict[str, Tuple[int, int, int]]
+
+
+def load_board(contest_cid: int) -> Board:
+    return {
+        user_name: (proofread_count, validated_count, points)
+        for user_name, proofread_count, validated_count, points in db.session.execute(
+            select(
+                ContestUserScore.user_name,
+                ContestUserScore.proofread_count,
+                ContestUserScore.validated_count,
+                ContestUserScore.points,
+            ).where(ContestUserScore.contest_cid == contest_cid)
+        )
+    }
+
+
+def board_rows(board: Board, user_names: Any) -> List[Dict[str, Any]]:
+    return [
+        {"user_name": name, "proofread_count": board[name][0], "validated_count": board[name][1], "points": board[name][2]}
+        for name in user_names
+    ]
+
+
+def event(kind: str, generation: int, data: Dict[str, Any]) -> str:
+    return f"id: {generation}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    def __init__(self, contest_cid: int, maxsize: int) -> None:
+        self.contest_cid = contest_cid
+        self.events: "queue.Queue[Optional[str]]" = queue.Queue(maxsize)
+        self.snapshot: str = ""
+
+
+class LeaderboardBroadcaster:
+    """Computes leaderboard deltas once per change and fans them out to every client"""
+
+    def __init__(self) -> None:
+        self.app: Optional[Flask] = None
+        self.poll_interval: float = 2.0
+        self.heartbeat: float = 15.0
+        self.queue_size: int = 100
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._boards: Dict[int, Board] = {}
+        self._generation: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+        self.poll_interval = app.config.get("LIVE_POLL_INTERVAL", 2.0)
+        self.heartbeat = app.config.get("LIVE_HEARTBEAT", 15.0)
+
+    def subscribe(self, contest_cid: int) -> Subscription:
+        """Register a client, needs an app context to load the snapshot if no one else is listening"""
+        subscription = Subscription(contest_cid, self.queue_size)
+        generation = current_generation()
+        fresh: Optional[Board] = None
+        while True:
+            with self._lock:
+                # Boards of watched contests are kept current by the broadcaster thread
+                board = self._boards.get(contest_cid, fresh)
+                if board is not None:
+                    self._boards[contest_cid] = board
+                    self._subscribers.setdefault(contest_cid, set()).add(subscription)
+                    ranked = sorted(board, key=lambda name: (-board[name][2], name))
+                    subscription.snapshot = event(
+                        "snapshot", self._generation or generation, {"contest_id": contest_cid, "users": board_rows(board, ranked)}
+                    )
+                    if self._thread is None:
+                        self._thread = threading.Thread(target=self._run, name="live-leaderboard", daemon=True)
+                        self._thread.start()
+                    return subscription
+            fresh = load_board(contest_cid)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.contest_cid, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.contest_cid, None)
+                self._boards.pop(subscription.contest_cid, None)
+
+    def stream(self, subscription: Subscription) -> Iterator[str]:
+        """Body of the SSE response: the snapshot, then deltas, with comments as keep-alive"""
+        try:
+            yield f"retry: {int(self.poll_interval * 1000)}\n" + subscription.snapshot
+            while True:
+                try:
+                    message = subscription.events.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    # Too slow to keep up, the client reconnects and gets a new snapshot
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Live leaderboard update failed")
+
+    def poll(self) -> None:
+        """Push deltas to every client if the data changed since the last poll"""
+        with self._lock:
+            contest_cids = list(self._subscribers)
+        if not contest_cids:
+            return
+        with self.app.app_context():
+            g.read_replica = True
+            generation = current_generation()
+            if generation == self._generation:
+                return
+            boards = {contest_cid: load_board(contest_cid) for contest_cid in contest_cids}
+        with self._lock:
+            self._generation = generation
+            for contest_cid, board in boards.items():
+                if contest_cid not in self._subscribers:
+                    continue
+                old = self._boards.get(contest_cid, {})
+                self._boards[contest_cid] = board
+                changed = sorted(name for name in board if old.get(name) != board[name])
+                removed = sorted(old.keys() - board.keys())
+                if not changed and not removed:
+                    continue
+                message = event("delta", generation, {
+                    "contest_id": contest_cid,
+                    "changed": board_rows(board, changed),
+                    "removed": removed,
+                })
+                for subscription in list(self._subscribers[contest_cid]):
+                    try:
+                        subscription.events.put_nowait(message)
+                    except queue.Full:
+                        self._drop(subscription)
+
+    def _drop(self, subscription: Subscription) -> None:
+        # Called with the lock held
+        self._subscribers[subscription.contest_cid].discard(subscription)
+        while True:
+            try:
+                subscription.events.get_nowait()
+            except queue.Empty:
+                break
+        subscription.events.put_nowait(None)
+
+
+broadcaster: LeaderboardBroadcaster = LeaderboardBroadcaster()
@@ -0,0 +1,193 @@
+"""Per-request metrics in the Prometheus text format, served at ``/metrics``.
+
+Every request records its latency, the number and total time of the SQL
+statements it ran and the size of its body, labelled with the route rule so
+``/api/contest/1`` and ``/api/contest/2`` count as the same route. Metrics are
+kept per process; with several gunicorn workers each scrape sees one worker.
+
+With ``METRICS_SLOW_REQUEST_SECONDS`` set, requests slower than that are
+logged together with the statements they ran.
+
+``/metrics`` and the other internal views wrapped in ``internal_only`` only
+answer clients in ``METRICS_ALLOWED_IPS``, localhost by default. The address
+checked is the one the request came from, so behind a reverse proxy the
+scraper has to reach the app directly.
+"""
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import ipaddress
+import logging
+import threading
+import time
+
+from flask import Flask, Response, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from db_pool import pool_stats
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS: List[float] = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERY_COUNT_BUCKETS: List[float] = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+BYTES_BUCKETS: List[float] = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+
+Labels = Tuple[Tuple[str, str], ...]
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: List[float]) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets + [float("inf")]
+        # labels -> count per bucket, sum of the observed values
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, labels: Dict[str, str], value: float) -> None:
+        key: Labels = tuple(sorted(labels.items()))
+        counts, total = self._series.setdefault(key, ([0] * len(self.buckets), [0.0]))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', '+Inf' if bound == float('inf') else str(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total[0]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+def _metric(name: str, help: str, kind: str, samples: List[Tuple[Labels, Any]]) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in samples)
+    return lines
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.app: Optional[Flask] = None
+        self.slow_request_seconds: float = 0.0
+        self.allowed_networks: List[Network] = []
+        self._lock = threading.Lock()
+        self.latency = Histogram(
+            "http_request_duration_seconds", "Time to build the response", LATENCY_BUCKETS
+        )
+        self.queries = Histogram(
+            "http_request_sql_queries", "SQL statements run by a request", QUERY_COUNT_BUCKETS
+        )
+        self.sql_time = Histogram(
+            "http_request_sql_duration_seconds", "Time a request spent in SQL statements", LATENCY_BUCKETS
+        )
+        self.response_bytes = Histogram(
+            "http_response_size_bytes", "Size of response bodies, streamed ones excluded", BYTES_BUCKETS
+        )
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+        self.slow_request_seconds = app.config.get("METRICS_SLOW_REQUEST_SECONDS", 0.0)
+        self.allowed_networks = [
+            ipaddress.ip_network(value, strict=False) for value in app.config.get("METRICS_ALLOWED_IPS", ["127.0.0.1", "::1"])
+        ]
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+        app.add_url_rule("/metrics", "metrics", self.internal_only(self.view))
+
+    def allowed(self, address: Optional[str]) -> bool:
+        try:
+            ip = ipaddress.ip_address(address or "")
+        except ValueError:
+            return False
+        if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        return any(ip in network for network in self.allowed_networks)
+
+    def internal_only(self, view: Callable[..., Any]) -> Callable[..., Any]:
+        """Answer 403 to clients outside ``METRICS_ALLOWED_IPS``"""
+
+        @wraps(view)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not self.allowed(request.remote_addr):
+                return jsonify({"error": "Forbidden"}), 403
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    def _before_request(self) -> None:
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql = []
+
+    def _before_cursor_execute(self, conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        conn.info["metrics_query_start"] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        elapsed = time.perf_counter() - conn.info.pop("metrics_query_start", time.perf_counter())
+        if has_request_context() and "metrics_sql" in g:
+            g.metrics_sql.append((statement, elapsed))
+
+    def _after_request(self, response: Response) -> Response:
+        if "metrics_start" not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_start
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        statements: List[Tuple[str, float]] = g.metrics_sql
+        sql_time = sum(duration for _, duration in statements)
+        size = None if response.is_streamed else response.calculate_content_length()
+        with self._lock:
+            self.latency.observe({"route": route, "method": request.method, "status": str(response.status_code)}, elapsed)
+            self.queries.observe({"route": route}, len(statements))
+            self.sql_time.observe({"route": route}, sql_time)
+            if size is not None:
+                self.response_bytes.observe({"route": route}, size)
+        if self.slow_request_seconds and elapsed >= self.slow_request_seconds:
+            logger.warning(
+                "Slow request %s %s: %.3fs, %d queries in %.3fs%s",
+                request.method, request.full_path, elapsed, len(statements), sql_time,
+                "".join(f"\n  {duration * 1000:.1f}ms {' '.join(statement.split())}" for statement, duration in statements),
+            )
+        return response
+
+    def render(self) -> str:
+        with self._lock:
+            lines = (
+                self.latency.render() + self.queries.render() + self.sql_time.render() + self.response_bytes.render()
+            )
+        pools = pool_stats(db.engines)
+        for name, key, kind, help in [
+            ("db_pool_checked_out", "checked_out", "gauge", "Connections in use"),
+            ("db_pool_checkouts_total", "checkouts", "counter", "Connections handed out by the pool"),
+            ("db_pool_wait_seconds_total", "wait_total_seconds", "counter", "Time spent waiting for a free connection"),
+            ("db_pool_wait_max_seconds", "wait_max_seconds", "gauge", "Longest wait for a free connection"),
+        ]:
+            samples = [((("engine", engine),), stats[key]) for engine, stats in pools.items() if key in stats]
+            if samples:
+                lines.extend(_metric(name, help, kind, samples))
+        return "\n".join(lines) + "\n"
+
+    def view(self) -> Response:
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+metrics: Metrics = Metrics()
@@ -0,0 +1,28 @@
+"""per contest and book sync watermarks
+
+Revision ID: 22b268f644c6
+Revises: 6e9f8dee345d
+Create Date: 2026-10-17 18:40:12.301552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '22b268f644c6'
+down_revision = '6e9f8dee345d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('book_contest_association_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_revid', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('synced_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('book_contest_association_table', schema=None) as batch_op:
+        batch_op.drop_column('synced_at')
+        batch_op.drop_column('last_revid')
@@ -0,0 +1,28 @@
+"""contest list keyset indexes
+
+Revision ID: 6fd01db0e1c4
+Revises: 734007dc570c
+Create Date: 2026-10-17 21:17:48.206331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6fd01db0e1c4'
+down_revision = '734007dc570c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('contest', schema=None) as batch_op:
+        batch_op.create_index('ix_contest_end_date', ['end_date', 'cid'], unique=False)
+        batch_op.create_index('ix_contest_lang_end_date', ['lang', 'end_date', 'cid'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('contest', schema=None) as batch_op:
+        batch_op.drop_index('ix_contest_lang_end_date')
+        batch_op.drop_index('ix_contest_end_date')
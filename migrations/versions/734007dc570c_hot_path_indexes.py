@@ -0,0 +1,64 @@
+"""keys and indexes for the hot query paths
+
+Revision ID: 734007dc570c
+Revises: e1a8521532ea
+Create Date: 2026-10-17 20:51:09.772641
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '734007dc570c'
+down_revision = 'e1a8521532ea'
+branch_labels = None
+depends_on = None
+
+# table: (first key column, second key column, reverse index, extra columns)
+ASSOCIATION_TABLES = {
+    'association_table': ('contest_cid', 'contest_admin_user_name', 'ix_association_table_admin', []),
+    'jury_association_table': ('contest_cid', 'jury_user_name', 'ix_jury_association_table_jury', []),
+    'book_contest_association_table': ('contest_cid', 'book_name', 'ix_book_contest_association_table_book', ['last_revid', 'synced_at']),
+    'user_contest_association_table': ('contest_cid', 'user_name', 'ix_user_contest_association_table_user', []),
+}
+
+
+def _dedupe(table, first, second, extra):
+    # Keep one row per key; the lowest watermark is the safe one to keep
+    columns = ', '.join([first, second] + extra)
+    aggregates = ', '.join([first, second] + [f'MIN({column})' for column in extra])
+    op.execute(
+        f'CREATE TABLE tmp_{table} AS SELECT {aggregates} FROM {table}'
+        f' WHERE {first} IS NOT NULL AND {second} IS NOT NULL GROUP BY {first}, {second}'
+    )
+    op.execute(f'DELETE FROM {table}')
+    op.execute(f'INSERT INTO {table} ({columns}) SELECT * FROM tmp_{table}')
+    op.execute(f'DROP TABLE tmp_{table}')
+
+
+def upgrade():
+    for table, (first, second, reverse_index, extra) in ASSOCIATION_TABLES.items():
+        _dedupe(table, first, second, extra)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(first, existing_type=sa.Integer(), nullable=False)
+            batch_op.alter_column(second, existing_type=sa.String(length=190), nullable=False)
+            batch_op.create_primary_key(f'pk_{table}', [first, second])
+            batch_op.create_index(reverse_index, [second, first], unique=False)
+
+    with op.batch_alter_table('index_page', schema=None) as batch_op:
+        batch_op.create_index('ix_index_page_proofreader', ['proofreader_username', 'proofread_time'], unique=False)
+        batch_op.create_index('ix_index_page_validator', ['validator_username', 'validate_time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('index_page', schema=None) as batch_op:
+        batch_op.drop_index('ix_index_page_validator')
+        batch_op.drop_index('ix_index_page_proofreader')
+
+    for table, (first, second, reverse_index, extra) in ASSOCIATION_TABLES.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(reverse_index)
+            batch_op.drop_constraint(f'pk_{table}', type_='primary')
+            batch_op.alter_column(second, existing_type=sa.String(length=190), nullable=True)
+            batch_op.alter_column(first, existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,39 @@
+"""unique index page per book
+
+Revision ID: 7ea5051fa925
+Revises: 22b268f644c6
+Create Date: 2026-10-17 19:02:44.918305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7ea5051fa925'
+down_revision = '22b268f644c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Every sync used to insert the whole crawl again, keep only the newest row of each page
+    op.execute(
+        "UPDATE review SET page_id = ("
+        " SELECT MAX(k.id) FROM index_page k JOIN index_page p"
+        " ON k.book_name = p.book_name AND k.page_name = p.page_name"
+        " WHERE p.id = review.page_id"
+        ") WHERE page_id IN (SELECT id FROM index_page WHERE book_name IS NOT NULL)"
+    )
+    op.execute(
+        "DELETE FROM index_page WHERE book_name IS NOT NULL AND id NOT IN ("
+        " SELECT id FROM (SELECT MAX(id) AS id FROM index_page GROUP BY book_name, page_name) AS keep"
+        ")"
+    )
+    with op.batch_alter_table('index_page', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_index_page_book_page', ['book_name', 'page_name'])
+
+
+def downgrade():
+    with op.batch_alter_table('index_page', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_index_page_book_page', type_='unique')
@@ -0,0 +1,36 @@
+"""sync checkpoints
+
+Revision ID: 8776b3843bd1
+Revises: 7ea5051fa925
+Create Date: 2026-10-17 19:31:05.114870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8776b3843bd1'
+down_revision = '7ea5051fa925'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sync_checkpoint',
+    sa.Column('contest_cid', sa.Integer(), nullable=False),
+    sa.Column('book_name', sa.String(length=190), nullable=False),
+    sa.Column('page_count', sa.Integer(), nullable=True),
+    sa.Column('pages_done', sa.Integer(), nullable=False),
+    sa.Column('max_revid', sa.Integer(), nullable=True),
+    sa.Column('min_failed_revid', sa.Integer(), nullable=True),
+    sa.Column('completed', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['book_name'], ['book.name'], ),
+    sa.ForeignKeyConstraint(['contest_cid'], ['contest.cid'], ),
+    sa.PrimaryKeyConstraint('contest_cid', 'book_name')
+    )
+
+
+def downgrade():
+    op.drop_table('sync_checkpoint')
@@ -0,0 +1,29 @@
+"""data generation counter for the response cache
+
+Revision ID: e1a8521532ea
+Revises: e74890215519
+Create Date: 2026-10-17 20:24:37.508113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1a8521532ea'
+down_revision = 'e74890215519'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    data_generation = op.create_table('data_generation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(data_generation, [{'id': 1, 'value': 0}])
+
+
+def downgrade():
+    op.drop_table('data_generation')
@@ -0,0 +1,96 @@
+"""hourly contribution rollup for the graphs
+
+Revision ID: e29b6d4d81c9
+Revises: 5764a925f53e
+Create Date: 2026-10-17 23:12:48.901552
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e29b6d4d81c9'
+down_revision = '5764a925f53e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('contribution_rollup',
+    sa.Column('contest_cid', sa.Integer(), nullable=False),
+    sa.Column('user_name', sa.String(length=190), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('proofread_count', sa.Integer(), nullable=False),
+    sa.Column('validated_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['contest_cid'], ['contest.cid'], ),
+    sa.ForeignKeyConstraint(['user_name'], ['user.user_name'], ),
+    sa.PrimaryKeyConstraint('contest_cid', 'user_name', 'bucket_start')
+    )
+    with op.batch_alter_table('contribution_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_contribution_rollup_bucket', ['bucket_start'], unique=False)
+        batch_op.create_index('ix_contribution_rollup_user', ['user_name', 'bucket_start'], unique=False)
+    _backfill()
+
+
+def _hour(column):
+    if op.get_bind().dialect.name == 'mysql':
+        return sa.func.date_format(column, '%Y-%m-%d %H:00:00')
+    return sa.func.strftime('%Y-%m-%d %H:00:00', column)
+
+
+def _backfill():
+    """Build the rollup of every contest once, later the sync keeps it up to date"""
+    bind = op.get_bind()
+    contest = sa.table('contest', sa.column('cid'), sa.column('start_date', sa.DateTime), sa.column('end_date', sa.DateTime))
+    books = sa.table('book_contest_association_table', sa.column('contest_cid'), sa.column('book_name'))
+    page = sa.table(
+        'index_page', sa.column('book_name'),
+        sa.column('proofreader_username'), sa.column('proofread_time', sa.DateTime),
+        sa.column('validator_username'), sa.column('validate_time', sa.DateTime),
+    )
+    rollup = sa.table(
+        'contribution_rollup', sa.column('contest_cid'), sa.column('user_name'), sa.column('bucket_start', sa.DateTime),
+        sa.column('proofread_count'), sa.column('validated_count'),
+    )
+    for cid, start_date, end_date in bind.execute(sa.select(contest.c.cid, contest.c.start_date, contest.c.end_date)).all():
+        if start_date is None or end_date is None:
+            continue
+        buckets = {}
+        for index, (user_column, time_column) in enumerate([
+            (page.c.proofreader_username, page.c.proofread_time),
+            (page.c.validator_username, page.c.validate_time),
+        ]):
+            hour = _hour(time_column)
+            rows = bind.execute(
+                sa.select(user_column, hour, sa.func.count())
+                .select_from(page.join(books, books.c.book_name == page.c.book_name))
+                .where(books.c.contest_cid == cid)
+                .where(user_column.is_not(None))
+                .where(time_column >= start_date)
+                .where(time_column < end_date + timedelta(days=1))
+                .group_by(user_column, hour)
+            )
+            for user_name, bucket_start, count in rows:
+                buckets.setdefault((user_name, bucket_start), [0, 0])[index] = count
+        if buckets:
+            op.bulk_insert(rollup, [
+                {
+                    'contest_cid': cid,
+                    'user_name': user_name,
+                    'bucket_start': datetime.strptime(bucket_start, '%Y-%m-%d %H:00:00'),
+                    'proofread_count': counts[0],
+                    'validated_count': counts[1],
+                }
+                for (user_name, bucket_start), counts in buckets.items()
+            ])
+
+
+def downgrade():
+    with op.batch_alter_table('contribution_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_contribution_rollup_user')
+        batch_op.drop_index('ix_contribution_rollup_bucket')
+
+    op.drop_table('contribution_rollup')
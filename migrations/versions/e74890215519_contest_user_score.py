@@ -0,0 +1,97 @@
+"""contest leaderboard table
+
+Revision ID: e74890215519
+Revises: 8776b3843bd1
+Create Date: 2026-10-17 19:58:21.640213
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e74890215519'
+down_revision = '8776b3843bd1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('contest_user_score',
+    sa.Column('contest_cid', sa.Integer(), nullable=False),
+    sa.Column('user_name', sa.String(length=190), nullable=False),
+    sa.Column('proofread_count', sa.Integer(), nullable=False),
+    sa.Column('validated_count', sa.Integer(), nullable=False),
+    sa.Column('points', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['contest_cid'], ['contest.cid'], ),
+    sa.ForeignKeyConstraint(['user_name'], ['user.user_name'], ),
+    sa.PrimaryKeyConstraint('contest_cid', 'user_name')
+    )
+    with op.batch_alter_table('contest_user_score', schema=None) as batch_op:
+        batch_op.create_index('ix_contest_user_score_points', ['contest_cid', 'points'], unique=False)
+    _backfill()
+
+
+def _backfill():
+    """Build the leaderboard of every contest once, ended ones included; later the sync keeps them up to date"""
+    bind = op.get_bind()
+    contest = sa.table(
+        'contest', sa.column('cid'), sa.column('start_date', sa.DateTime), sa.column('end_date', sa.DateTime),
+        sa.column('point_per_proofread'), sa.column('point_per_validate'),
+    )
+    books = sa.table('book_contest_association_table', sa.column('contest_cid'), sa.column('book_name'))
+    members = sa.table('user_contest_association_table', sa.column('contest_cid'), sa.column('user_name'))
+    page = sa.table(
+        'index_page', sa.column('book_name'),
+        sa.column('proofreader_username'), sa.column('proofread_time', sa.DateTime),
+        sa.column('validator_username'), sa.column('validate_time', sa.DateTime),
+    )
+    score = sa.table(
+        'contest_user_score', sa.column('contest_cid'), sa.column('user_name'),
+        sa.column('proofread_count'), sa.column('validated_count'), sa.column('points'),
+    )
+    contests = bind.execute(sa.select(
+        contest.c.cid, contest.c.start_date, contest.c.end_date,
+        contest.c.point_per_proofread, contest.c.point_per_validate,
+    )).all()
+    for cid, start_date, end_date, point_per_proofread, point_per_validate in contests:
+        counts = {
+            user_name: [0, 0]
+            for user_name in bind.execute(sa.select(members.c.user_name).where(members.c.contest_cid == cid)).scalars()
+        }
+        if start_date is not None and end_date is not None:
+            for index, (user_column, time_column) in enumerate([
+                (page.c.proofreader_username, page.c.proofread_time),
+                (page.c.validator_username, page.c.validate_time),
+            ]):
+                rows = bind.execute(
+                    sa.select(user_column, sa.func.count())
+                    .select_from(page.join(books, books.c.book_name == page.c.book_name))
+                    .where(books.c.contest_cid == cid)
+                    .where(user_column.is_not(None))
+                    .where(time_column >= start_date)
+                    .where(time_column < end_date + timedelta(days=1))
+                    .group_by(user_column)
+                )
+                for user_name, count in rows:
+                    counts.setdefault(user_name, [0, 0])[index] = count
+        if counts:
+            op.bulk_insert(score, [
+                {
+                    'contest_cid': cid,
+                    'user_name': user_name,
+                    'proofread_count': proofread_count,
+                    'validated_count': validated_count,
+                    'points': proofread_count * (point_per_proofread or 0) + validated_count * (point_per_validate or 0),
+                }
+                for user_name, (proofread_count, validated_count) in counts.items()
+            ])
+
+
+def downgrade():
+    with op.batch_alter_table('contest_user_score', schema=None) as batch_op:
+        batch_op.drop_index('ix_contest_user_score_points')
+
+    op.drop_table('contest_user_score')
@@ -10,31 +10,43 @@ DB_URL: str = "" if curr_env == "production" else "localhost"
 
 association_table = db.Table(
     "association_table",
-    db.Column("contest_cid", db.ForeignKey("contest.cid")),
-    db.Column("contest_admin_user_name", db.ForeignKey("contest_admin.user_name")),
+    db.Column("contest_cid", db.ForeignKey("contest.cid"), primary_key=True),
+    db.Column("contest_admin_user_name", db.ForeignKey("contest_admin.user_name"), primary_key=True),
+    db.Index("ix_association_table_admin", "contest_admin_user_name", "contest_cid"),
 )
 
 jury_association_table = db.Table(
     "jury_association_table",
-    db.Column("contest_cid", db.ForeignKey("contest.cid")),
-    db.Column("jury_user_name", db.ForeignKey("jury.user_name")),
+    db.Column("contest_cid", db.ForeignKey("contest.cid"), primary_key=True),
+    db.Column("jury_user_name", db.ForeignKey("jury.user_name"), primary_key=True),
+    db.Index("ix_jury_association_table_jury", "jury_user_name", "contest_cid"),
 )
 
 book_contest_association_table = db.Table(
     "book_contest_association_table",
-    db.Column("contest_cid", db.ForeignKey("contest.cid")),
-    db.Column("book_name", db.ForeignKey("book.name")),
+    db.Column("contest_cid", db.ForeignKey("contest.cid"), primary_key=True),
+    db.Column("book_name", db.ForeignKey("book.name"), primary_key=True),
+    # Sync watermark: highest revision id of the book's pages already processed for this contest
+    db.Column("last_revid", db.Integer, default=None),
+    db.Column("synced_at", db.DateTime, default=None),
+    db.Index("ix_book_contest_association_table_book", "book_name", "contest_cid"),
 )
 
 user_contest_association_table = db.Table(
     "user_contest_association_table",
-    db.Column("contest_cid", db.ForeignKey("contest.cid")),
-    db.Column("user_name", db.ForeignKey("user.user_name")),
+    db.Column("contest_cid", db.ForeignKey("contest.cid"), primary_key=True),
+    db.Column("user_name", db.ForeignKey("user.user_name"), primary_key=True),
+    db.Index("ix_user_contest_association_table_user", "user_name", "contest_cid"),
 )
 
 @dataclass
 class Contest(db.Model):
     __tablename__ = "contest"
+    # Keyset pagination of the contest list, optionally per language
+    __table_args__ = (
+        db.Index("ix_contest_end_date", "end_date", "cid"),
+        db.Index("ix_contest_lang_end_date", "lang", "end_date", "cid"),
+    )
 
     cid: Mapped[int] = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = db.Column(db.String(190), nullable=False)
@@ -83,6 +95,12 @@ class Book(db.Model):
 @dataclass
 class IndexPage(db.Model):
     __tablename__ = "index_page"
+    __table_args__ = (
+        db.UniqueConstraint("book_name", "page_name", name="uq_index_page_book_page"),
+        # Leaderboard counts and per-user page lists filter on the credited user and time
+        db.Index("ix_index_page_proofreader", "proofreader_username", "proofread_time"),
+        db.Index("ix_index_page_validator", "validator_username", "validate_time"),
+    )
 
     id: Mapped[int] = db.Column(db.Integer, primary_key=True, autoincrement=True)
     page_name: Mapped[str] = db.Column(db.String(190), nullable=False)
@@ -151,3 +169,72 @@ class Review(db.Model):
 
     page: Mapped["IndexPage"] = relationship("IndexPage", back_populates="reviews")
     reviewer: Mapped["User"] = relationship("User", back_populates="reviews")
+
+@dataclass
+class ContestUserScore(db.Model):
+    """Leaderboard row of a user in a contest, maintained by db_update"""
+    __tablename__ = "contest_user_score"
+    __table_args__ = (db.Index("ix_contest_user_score_points", "contest_cid", "points"),)
+
+    contest_cid: Mapped[int] = db.Column(db.Integer, db.ForeignKey("contest.cid"), primary_key=True)
+    user_name: Mapped[str] = db.Column(db.String(190), db.ForeignKey("user.user_name"), primary_key=True)
+    proofread_count: Mapped[int] = db.Column(db.Integer, nullable=False, default=0)
+    validated_count: Mapped[int] = db.Column(db.Integer, nullable=False, default=0)
+    points: Mapped[int] = db.Column(db.Integer, nullable=False, default=0)
+
+@dataclass
+class ContributionRollup(db.Model):
+    """Proofreads and validations credited to a user in a contest per hour, maintained by db_update"""
+    __tablename__ = "contribution_rollup"
+    __table_args__ = (
+        db.Index("ix_contribution_rollup_user", "user_name", "bucket_start"),
+        db.Index("ix_contribution_rollup_bucket", "bucket_start"),
+    )
+
+    contest_cid: Mapped[int] = db.Column(db.Integer, db.ForeignKey("contest.cid"), primary_key=True)
+    user_name: Mapped[str] = db.Column(db.String(190), db.ForeignKey("user.user_name"), primary_key=True)
+    # Start of the hour the edits were made in
+    bucket_start: Mapped[datetime] = db.Column(db.DateTime, primary_key=True)
+    proofread_count: Mapped[int] = db.Column(db.Integer, nullable=False, default=0)
+    validated_count: Mapped[int] = db.Column(db.Integer, nullable=False, default=0)
+
+@dataclass
+class SyncCheckpoint(db.Model):
+    """Progress of db_update through one book of a contest, kept until the run completes"""
+    __tablename__ = "sync_checkpoint"
+
+    contest_cid: Mapped[int] = db.Column(db.Integer, db.ForeignKey("contest.cid"), primary_key=True)
+    book_name: Mapped[str] = db.Column(db.String(190), db.ForeignKey("book.name"), primary_key=True)
+    page_count: Mapped[Optional[int]] = db.Column(db.Integer, default=None)
+    pages_done: Mapped[int] = db.Column(db.Integer, nullable=False, default=0)
+    max_revid: Mapped[Optional[int]] = db.Column(db.Integer, default=None)
+    min_failed_revid: Mapped[Optional[int]] = db.Column(db.Integer, default=None)
+    completed: Mapped[bool] = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at: Mapped[datetime] = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+@dataclass
+class DataGeneration(db.Model):
+    """Single row counter bumped on every change to contest data, keys the response cache"""
+    __tablename__ = "data_generation"
+
+    id: Mapped[int] = db.Column(db.Integer, primary_key=True)
+    value: Mapped[int] = db.Column(db.Integer, nullable=False, default=0)
+
+@dataclass
+class Job(db.Model):
+    """Background work queued by the web app and run by jobs.py, e.g. the first sync of a new contest"""
+    __tablename__ = "job"
+    __table_args__ = (db.Index("ix_job_status", "status", "id"),)
+
+    id: Mapped[int] = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = db.Column(db.String(50), nullable=False)
+    contest_cid: Mapped[Optional[int]] = db.Column(db.Integer, db.ForeignKey("contest.cid"), default=None)
+    # queued -> running -> done | failed
+    status: Mapped[str] = db.Column(db.String(20), nullable=False, default="queued")
+    progress: Mapped[int] = db.Column(db.Integer, nullable=False, default=0)
+    total: Mapped[Optional[int]] = db.Column(db.Integer, default=None)
+    result: Mapped[Optional[str]] = db.Column(db.Text, default=None)
+    error: Mapped[Optional[str]] = db.Column(db.Text, default=None)
+    created_at: Mapped[datetime] = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at: Mapped[Optional[datetime]] = db.Column(db.DateTime, default=None)
+    finished_at: Mapped[Optional[datetime]] = db.Column(db.DateTime, default=None)
@@ -0,0 +1,112 @@
+"""On-disk cache of page statuses, keyed by wiki, title and latest revision id.
+
+The proofread status of a page is worked out from its full revision history,
+which only changes when the page gets a new revision. A status cached for the
+latest revision id is therefore still right on the next run, and only pages
+edited since need their history fetched again. Entries live in a SQLite file
+shared by every process on the host, and the least recently used are evicted
+beyond ``PAGE_CACHE_SIZE`` pages.
+"""
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Titles per SELECT, below SQLite's limit on bound parameters
+LOOKUP_BATCH: int = 500
+
+
+class PageStatusCache:
+    def __init__(self, path: str, size: int) -> None:
+        self.path = path
+        self.size = size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS page_status ("
+            "wiki TEXT NOT NULL, title TEXT NOT NULL, revid INTEGER NOT NULL, status TEXT NOT NULL, "
+            "used_at REAL NOT NULL, PRIMARY KEY (wiki, title))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_page_status_used_at ON page_status (used_at)")
+        # Writes since the size was last checked
+        self._writes: int = size
+
+    def get_many(self, wiki: str, revids: Dict[str, Optional[int]]) -> Dict[str, Dict[str, Any]]:
+        """Cached statuses of the pages of ``revids`` whose latest revision is still the cached one"""
+        wanted = {title: revid for title, revid in revids.items() if revid is not None}
+        titles: List[str] = list(wanted)
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for start in range(0, len(titles), LOOKUP_BATCH):
+                batch = titles[start:start + LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT title, revid, status FROM page_status WHERE wiki = ? AND title IN ({','.join('?' * len(batch))})",
+                    [wiki, *batch],
+                )
+                for title, revid, status in rows:
+                    if revid == wanted[title]:
+                        found[title] = json.loads(status)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE page_status SET used_at = ? WHERE wiki = ? AND title = ?",
+                    [(now, wiki, title) for title in found],
+                )
+        return found
+
+    def put_many(self, wiki: str, statuses: Dict[str, Dict[str, Any]]) -> None:
+        """Store statuses carrying the ``revid`` they were fetched at"""
+        rows = [
+            (wiki, title, status["revid"], json.dumps(status), time.time())
+            for title, status in statuses.items() if status.get("revid") is not None
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO page_status (wiki, title, revid, status, used_at) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._writes += len(rows)
+            # Counting rows is a full scan, only do it every tenth of the size
+            if self._writes >= max(self.size // 10, 1000):
+                self._writes = 0
+                self._trim()
+
+    def _trim(self) -> None:
+        count: int = self._conn.execute("SELECT count(*) FROM page_status").fetchone()[0]
+        if count > self.size:
+            self._conn.execute(
+                "DELETE FROM page_status WHERE rowid IN (SELECT rowid FROM page_status ORDER BY used_at LIMIT ?)",
+                (count - self.size,),
+            )
+            logger.info("Evicted %d pages from the page status cache", count - self.size)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[PageStatusCache] = None
+_cache_lock = threading.Lock()
+
+
+def page_status_cache() -> Optional[PageStatusCache]:
+    """The cache of this process, ``None`` when ``PAGE_CACHE_SIZE`` is 0"""
+    global _cache
+    if not config["PAGE_CACHE_SIZE"]:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != config["PAGE_CACHE_PATH"]:
+            try:
+                _cache = PageStatusCache(config["PAGE_CACHE_PATH"], config["PAGE_CACHE_SIZE"])
+            except sqlite3.Error as e:
+                logger.warning("Page status cache %s unavailable: %s", config["PAGE_CACHE_PATH"], e)
+                return None
+        return _cache
@@ -0,0 +1,99 @@
+"""EXPLAIN checks for the hot queries of the app and the sync.
+
+    flask --app app check-query-plans
+
+Every query below is built by the same function the app or db_update uses, so
+a change that stops one of them from using an index is reported here.
+"""
+from typing import Any, Dict, List
+import datetime as dt
+
+from sqlalchemy import select
+
+from extensions import db
+from models import (
+    Contest,
+    ContestAdmin,
+    ContestUserScore,
+    ContributionRollup,
+    IndexPage,
+    association_table,
+    book_contest_association_table,
+    user_contest_association_table,
+)
+from sync_store import credited_counts_query, existing_pages_query
+
+
+def hot_queries() -> Dict[str, Any]:
+    from app import contest_user_pages_query
+
+    contest = Contest(cid=1, start_date=dt.datetime(2024, 1, 1), end_date=dt.datetime(2024, 2, 1))
+    return {
+        "proofread counts": credited_counts_query(
+            contest, IndexPage.proofreader_username, IndexPage.proofread_time, ["Example"]
+        ),
+        "validated counts": credited_counts_query(
+            contest, IndexPage.validator_username, IndexPage.validate_time, ["Example"]
+        ),
+        "existing pages of a book": existing_pages_query("Example.djvu", ["Page:Example.djvu/1"]),
+        "contest leaderboard": select(ContestUserScore)
+        .where(ContestUserScore.contest_cid == contest.cid)
+        .order_by(ContestUserScore.points.desc(), ContestUserScore.user_name),
+        "user pages in a contest": contest_user_pages_query(contest, "Example", 0).limit(51).statement,
+        "books of a contest": select(book_contest_association_table.c.book_name)
+        .where(book_contest_association_table.c.contest_cid == contest.cid),
+        "contests of a book": select(book_contest_association_table.c.contest_cid)
+        .where(book_contest_association_table.c.book_name == "Example.djvu"),
+        "memberships of contests": select(user_contest_association_table)
+        .where(user_contest_association_table.c.contest_cid.in_([1, 2])),
+        "contests of a user": select(user_contest_association_table.c.contest_cid)
+        .where(user_contest_association_table.c.user_name == "Example"),
+        "contest list page": select(Contest.cid, Contest.name, Contest.end_date)
+        .where((Contest.end_date < contest.end_date) | ((Contest.end_date == contest.end_date) & (Contest.cid < 10)))
+        .order_by(Contest.end_date.desc(), Contest.cid.desc())
+        .limit(51),
+        "graph of a contest": select(ContributionRollup.bucket_start, ContributionRollup.proofread_count)
+        .where(ContributionRollup.contest_cid == contest.cid)
+        .where(ContributionRollup.bucket_start >= contest.start_date),
+        "graph of a user": select(ContributionRollup.bucket_start, ContributionRollup.proofread_count)
+        .where(ContributionRollup.user_name == "Example")
+        .where(ContributionRollup.bucket_start >= contest.start_date),
+        "admins of a contest": select(ContestAdmin)
+        .join(association_table, association_table.c.contest_admin_user_name == ContestAdmin.user_name)
+        .where(association_table.c.contest_cid == contest.cid),
+    }
+
+
+def explain(stmt: Any) -> List[Dict[str, Any]]:
+    """Plan rows of a statement, as returned by the database"""
+    dialect = db.engine.dialect
+    sql = str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN " if dialect.name == "sqlite" else "EXPLAIN "
+    with db.engine.connect() as conn:
+        return [dict(row._mapping) for row in conn.exec_driver_sql(prefix + sql)]
+
+
+def full_scans(stmt: Any) -> List[str]:
+    """Plan lines that read a whole table without any usable index"""
+    dialect: str = db.engine.dialect.name
+    problems: List[str] = []
+    for row in explain(stmt):
+        if dialect == "sqlite":
+            detail: str = row["detail"]
+            if detail.startswith("SCAN ") and " USING " not in detail:
+                problems.append(detail)
+        elif dialect == "mysql":
+            # Tiny tables are scanned even when an index exists, only flag missing indexes
+            if row.get("type") == "ALL" and not row.get("possible_keys"):
+                problems.append(f"full scan of {row.get('table')}")
+    return problems
+
+
+def check_query_plans() -> Dict[str, List[str]]:
+    """Hot queries whose plan contains a full table scan, with the offending plan lines"""
+    problems: Dict[str, List[str]] = {}
+    for name, stmt in hot_queries().items():
+        scans = full_scans(stmt)
+        if scans:
+            problems[name] = scans
+    return problems
@@ -0,0 +1,148 @@
+"""Adaptive limit on the requests in flight against each wiki.
+
+Every request of a ``WikiClient`` goes through the ``RateController`` of its
+wiki. The limit starts at ``SYNC_CONCURRENCY`` and is halved whenever the
+wiki pushes back: a maxlag error, or HTTP 429 or 503. All requests to that
+wiki then wait out the Retry-After it sent. From ``INCREASE_DELAY`` seconds
+after the last decrease, each successful request raises the limit by
+``1 / limit``, about one more request in flight per round trip, back up to
+where it started.
+
+Failed requests are retried one by one, up to ``SYNC_MAX_ATTEMPTS`` times
+each. Retries come out of a budget of ``SYNC_RETRY_BUDGET`` times the requests
+made so far, so an outage does not turn into a retry storm.
+"""
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+import datetime as dt
+import logging
+import threading
+import time
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Retries always allowed before the budget applies, so a short run can recover from a blip
+MIN_RETRIES: int = 10
+# Pause when a throttling response does not say how long to wait
+DEFAULT_RETRY_AFTER: float = 5.0
+MAX_RETRY_AFTER: float = 120.0
+# Seconds the limit is held after a decrease before it may grow again
+INCREASE_DELAY: float = 10.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - dt.datetime.now(dt.timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class RateController:
+    def __init__(self, wiki: str, max_limit: int) -> None:
+        self.wiki = wiki
+        self.max_limit: int = max(1, max_limit)
+        self.limit: float = float(self.max_limit)
+        self.lowest_limit: float = self.limit
+        self.in_flight: int = 0
+        # time.monotonic() until which no request may start
+        self.paused_until: float = 0.0
+        self.paused_seconds: float = 0.0
+        self.last_decrease: float = float("-inf")
+        self.requests: int = 0
+        self.retries: int = 0
+        self.gave_up: int = 0
+        # reason (maxlag, 429, 503) -> responses
+        self.throttled: Dict[str, int] = {}
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        """Wait for a free slot under the current limit, and for any pause to end"""
+        with self._cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                self._cond.wait(wait if wait > 0 else None)
+            self.in_flight += 1
+            self.requests += 1
+
+    def release(self, throttled: Optional[str] = None, retry_after: Optional[float] = None) -> None:
+        """End a request, ``throttled`` with the reason if the wiki pushed back"""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled is None:
+                if now - self.last_decrease >= INCREASE_DELAY:
+                    self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            else:
+                self.throttled[throttled] = self.throttled.get(throttled, 0) + 1
+                delay = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+                # Requests that were in flight together see the same overload, halve once for all of them
+                if now - self.last_decrease >= max(delay, 1.0):
+                    self.limit = max(1.0, self.limit / 2)
+                    self.lowest_limit = min(self.lowest_limit, self.limit)
+                    self.last_decrease = now
+                    logger.warning(
+                        "%s throttled (%s), %d requests in flight allowed, pausing %.1fs",
+                        self.wiki, throttled, int(self.limit), delay,
+                    )
+                until = now + delay
+                if until > self.paused_until:
+                    self.paused_seconds += until - max(self.paused_until, now)
+                    self.paused_until = until
+            self._cond.notify_all()
+
+    def allow_retry(self) -> bool:
+        """Take a retry out of the budget, ``False`` once it is spent"""
+        with self._cond:
+            if self.retries < MIN_RETRIES + config["SYNC_RETRY_BUDGET"] * self.requests:
+                self.retries += 1
+                return True
+            return False
+
+    def record_give_up(self) -> None:
+        with self._cond:
+            self.gave_up += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "max_limit": self.max_limit,
+                "lowest_limit": round(self.lowest_limit, 2),
+                "requests": self.requests,
+                "throttled": dict(sorted(self.throttled.items())),
+                "paused_seconds": round(self.paused_seconds, 3),
+                "retries": self.retries,
+                "retry_budget_left": max(0, int(MIN_RETRIES + config["SYNC_RETRY_BUDGET"] * self.requests) - self.retries),
+                "gave_up": self.gave_up,
+            }
+
+
+_controllers: Dict[str, RateController] = {}
+_controllers_lock = threading.Lock()
+
+
+def rate_controller(endpoint: str, max_limit: int) -> RateController:
+    """The controller of a wiki, shared by all clients of this process"""
+    with _controllers_lock:
+        controller = _controllers.get(endpoint)
+        if controller is None:
+            controller = _controllers[endpoint] = RateController(endpoint, max_limit)
+        return controller
+
+
+def rate_control_stats() -> Dict[str, Dict[str, Any]]:
+    """``as_dict`` of every controller, by endpoint"""
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    return {controller.wiki: controller.as_dict() for controller in controllers}
@@ -0,0 +1,148 @@
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+import datetime as dt
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from flask import Flask, Response, make_response, request
+from sqlalchemy import select, update
+
+from extensions import db
+from models import DataGeneration
+
+logger = logging.getLogger(__name__)
+
+# etag, mimetype, extra headers, body
+CachedBody = Tuple[str, str, Dict[str, str], bytes]
+
+
+def current_generation() -> int:
+    """Counter bumped whenever contest data changes, part of every cache key"""
+    return db.session.scalar(select(DataGeneration.value).where(DataGeneration.id == 1)) or 0
+
+
+def bump_generation() -> None:
+    """Invalidate cached responses, call before committing a change to contest data"""
+    result = db.session.execute(
+        update(DataGeneration).where(DataGeneration.id == 1).values(value=DataGeneration.value + 1)
+    )
+    if result.rowcount == 0:
+        db.session.add(DataGeneration(id=1, value=1))
+
+
+class LRUCacheBackend:
+    """In-process cache, enough for a single worker and used as the stand-in in tests"""
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[int, str], CachedBody]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, generation: int, key: str) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get((generation, key))
+            if entry is not None:
+                self._entries.move_to_end((generation, key))
+            return entry
+
+    def set(self, generation: int, key: str, value: CachedBody) -> None:
+        with self._lock:
+            self._entries[(generation, key)] = value
+            self._entries.move_to_end((generation, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class FileCacheBackend:
+    """Cache in a directory shared by all gunicorn workers of a host.
+
+    Entries live in one sub-directory per generation; older generations are
+    removed as soon as a newer one is written since they can never be hit again.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, generation: int, key: str) -> str:
+        return os.path.join(self.directory, str(generation), hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, generation: int, key: str) -> Optional[CachedBody]:
+        try:
+            with open(self._path(generation, key), "rb") as f:
+                meta, body = f.read().split(b"\n", 1)
+            etag, mimetype, headers = json.loads(meta)
+        except (OSError, ValueError):
+            return None
+        return etag, mimetype, headers, body
+
+    def set(self, generation: int, key: str, value: CachedBody) -> None:
+        generation_dir = os.path.join(self.directory, str(generation))
+        if not os.path.isdir(generation_dir):
+            os.makedirs(generation_dir, exist_ok=True)
+            for name in os.listdir(self.directory):
+                if name.isdigit() and int(name) < generation:
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        etag, mimetype, headers, body = value
+        fd, tmp_path = tempfile.mkstemp(dir=generation_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps([etag, mimetype, headers]).encode() + b"\n" + body)
+        os.replace(tmp_path, self._path(generation, key))
+
+
+class ResponseCache:
+    """Caches GET responses per URL and data generation and answers conditional GETs"""
+
+    def __init__(self) -> None:
+        self.backend: Any = None
+
+    def init_app(self, app: Flask) -> None:
+        kind: str = app.config.get("RESPONSE_CACHE_BACKEND", "memory")
+        if kind == "memory":
+            self.backend = LRUCacheBackend(app.config.get("RESPONSE_CACHE_SIZE", 256))
+        elif kind == "file":
+            self.backend = FileCacheBackend(app.config["RESPONSE_CACHE_DIR"])
+        elif kind == "none":
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND {kind!r}")
+
+    def cached(self, view: Callable[..., Any]) -> Callable[..., Response]:
+        """Decorate a JSON view; only 200 responses are cached"""
+
+        @wraps(view)
+        def wrapper(*args: Any, **kwargs: Any) -> Response:
+            if self.backend is None:
+                return make_response(view(*args, **kwargs))
+            generation = current_generation()
+            # Running/ended flags depend on the date as well as on the data
+            key = f"{dt.date.today().isoformat()} {request.full_path}"
+            entry = self.backend.get(generation, key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                headers = {
+                    name: value for name, value in response.headers.items()
+                    if name.lower() not in ("content-type", "content-length", "etag", "cache-control")
+                }
+                entry = (hashlib.sha1(body).hexdigest(), response.mimetype, headers, body)
+                self.backend.set(generation, key, entry)
+            etag, mimetype, headers, body = entry
+            response = Response(body, mimetype=mimetype, headers=headers)
+            response.set_etag(etag)
+            # Let clients keep the body but revalidate it on every use
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+
+        return wrapper
+
+
+response_cache: ResponseCache = ResponseCache()
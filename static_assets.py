@@ -0,0 +1,146 @@
+"""In-memory manifest of the frontend build, scanned once at startup.
+
+Requests for the frontend never touch the filesystem: bodies, ETags and the
+precompressed ``.br``/``.gz`` variants produced by the build are all looked
+up in the manifest. Fingerprinted files (``assets/index-3f2a1b9c.js``) never
+change under the same name, so browsers may keep them for a year. They are
+the files listed in the build manifest of Vite when the build writes one
+(``build.manifest``), else the files of ``assets/`` whose name ends in a hash.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+
+from flask import Request, Response
+
+logger = logging.getLogger(__name__)
+
+# Where Vite puts the files it names [name]-[hash].[ext]
+ASSETS_DIR: str = "assets/"
+
+# A hex or base64url hash of at least 8 characters before the extension, not a lowercase word
+FINGERPRINT = re.compile(r"-(?![a-z]+\.)[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+
+# Where Vite writes its build manifest, from version 5 and before
+BUILD_MANIFESTS: List[str] = [".vite/manifest.json", "manifest.json"]
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS: Dict[str, str] = {"br": ".br", "gzip": ".gz"}
+
+IMMUTABLE: str = "public, max-age=31536000, immutable"
+
+
+@dataclass
+class Asset:
+    body: bytes
+    mimetype: str
+    etag: str
+    immutable: bool
+    # Content-Encoding -> compressed body
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def is_fingerprinted(url_path: str) -> bool:
+    """Whether a file looks like hashed build output, for builds without a manifest
+
+    >>> is_fingerprinted("assets/index-DiwrgTda.js")
+    True
+    >>> is_fingerprinted("assets/index-3f2a1b9c.css")
+    True
+    >>> is_fingerprinted("assets/logo-B_x9-Qe2.svg")
+    True
+    >>> is_fingerprinted("logo-Wikisource.svg")
+    False
+    >>> is_fingerprinted("assets/vendor-fallback.js")
+    False
+    """
+    return url_path.startswith(ASSETS_DIR) and bool(FINGERPRINT.search(url_path.rsplit("/", 1)[-1]))
+
+
+def fingerprinted_files(folder: str) -> Optional[Set[str]]:
+    """Paths of the hashed files of the build manifest, ``None`` without one"""
+    for name in BUILD_MANIFESTS:
+        try:
+            entries: Any = json.loads(_read(os.path.join(folder, name)))
+        except (OSError, ValueError):
+            continue
+        if not isinstance(entries, dict):
+            continue
+        # manifest.json may as well be the web app manifest, which has no chunks
+        chunks = [entry for entry in entries.values() if isinstance(entry, dict) and "file" in entry]
+        if chunks:
+            return {
+                path for chunk in chunks
+                for path in [chunk["file"], *chunk.get("css", []), *chunk.get("assets", [])]
+            }
+    return None
+
+
+class StaticManifest:
+    def __init__(self, folder: Optional[str]) -> None:
+        self.folder = folder
+        self.assets: Dict[str, Asset] = {}
+        if folder:
+            self.scan()
+
+    def scan(self) -> None:
+        assets: Dict[str, Asset] = {}
+        fingerprinted = fingerprinted_files(self.folder)
+        for root, _, files in os.walk(self.folder):
+            names = set(files)
+            for name in files:
+                if any(name.endswith(suffix) and name[:-len(suffix)] in names for suffix in ENCODINGS.values()):
+                    # Served as a variant of the uncompressed file
+                    continue
+                path = os.path.join(root, name)
+                url_path = os.path.relpath(path, self.folder).replace(os.sep, "/")
+                body = _read(path)
+                asset = Asset(
+                    body=body,
+                    mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream",
+                    etag=hashlib.sha1(body).hexdigest(),
+                    immutable=(
+                        url_path in fingerprinted if fingerprinted is not None else is_fingerprinted(url_path)
+                    ),
+                )
+                for encoding, suffix in ENCODINGS.items():
+                    if name + suffix in names:
+                        asset.variants[encoding] = _read(path + suffix)
+                assets[url_path] = asset
+        self.assets = assets
+        logger.info(f"Loaded {len(assets)} frontend files from {self.folder}")
+
+    @property
+    def index(self) -> Optional[Asset]:
+        return self.assets.get("index.html")
+
+    def response(self, asset: Asset, request: Request) -> Response:
+        """The asset in the best encoding the client accepts, answering conditional GETs"""
+        accepted: List[str] = [
+            encoding for encoding in asset.variants if request.accept_encodings.quality(encoding) > 0
+        ]
+        body, etag = asset.body, asset.etag
+        response = Response(mimetype=asset.mimetype)
+        if accepted:
+            encoding = accepted[0]
+            body, etag = asset.variants[encoding], f"{asset.etag}-{encoding}"
+            response.content_encoding = encoding
+        if asset.variants:
+            response.vary.add("Accept-Encoding")
+        response.set_data(body)
+        response.set_etag(etag)
+        if asset.immutable:
+            response.headers["Cache-Control"] = IMMUTABLE
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
@@ -0,0 +1,245 @@
+"""Resident sync service, in place of running ``db_update.py`` from cron.
+
+    python sync_daemon.py
+
+Running contests wait in a priority queue ordered by when they are next due.
+A contest that had new edits in its last sync, or that ends within
+``SYNC_DAEMON_URGENT_HOURS``, is synced every ``SYNC_DAEMON_MIN_INTERVAL``
+seconds; each sync that finds nothing new doubles the wait of a quiet contest,
+up to ``SYNC_DAEMON_MAX_INTERVAL``. Once a contest has ended it gets a last
+sync and a full leaderboard rebuild, is marked as ended and leaves the queue.
+
+One ``WikiClient`` per wiki is kept for the life of the process, with its
+fetching threads and their connections. SIGTERM and SIGINT stop the service
+after the book being synced; the rest of that contest resumes from its
+checkpoints on the next start.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import datetime as dt
+import heapq
+import logging
+import signal
+import sys
+import threading
+import time
+
+from flask import Flask
+
+from config import config
+from contest_sync import USER_AGENT, ensure_leaderboard, sync_contest
+from extensions import db
+from jobs import contests_with_running_jobs
+from models import Contest
+from response_cache import bump_generation
+from sync_stats import SyncStats
+from sync_store import UserCache, clear_checkpoints, contest_window, load_checkpoints
+from ws_client import WikiClient
+
+logger = logging.getLogger(__name__)
+
+
+class ShutdownRequested(Exception):
+    pass
+
+
+@dataclass
+class ScheduledContest:
+    cid: int
+    name: str
+    lang: str
+    # Exclusive end of the contest window, the day after end_date
+    ends_at: dt.datetime
+    # Seconds until the next sync, doubled after every quiet one
+    interval: float
+    # time.monotonic() at which the contest is next due
+    due: float
+
+
+class SyncDaemon:
+    def __init__(
+        self,
+        app: Flask,
+        min_interval: Optional[float] = None,
+        max_interval: Optional[float] = None,
+        urgent_hours: Optional[float] = None,
+        rescan_interval: Optional[float] = None,
+    ) -> None:
+        self.app = app
+        self.min_interval: float = min_interval or config["SYNC_DAEMON_MIN_INTERVAL"]
+        self.max_interval: float = max(max_interval or config["SYNC_DAEMON_MAX_INTERVAL"], self.min_interval)
+        self.urgent_window = dt.timedelta(hours=urgent_hours or config["SYNC_DAEMON_URGENT_HOURS"])
+        self.rescan_interval: float = rescan_interval or config["SYNC_DAEMON_RESCAN_INTERVAL"]
+        self.contests: Dict[int, ScheduledContest] = {}
+        # (due, cid); entries whose due no longer matches self.contests are stale and skipped
+        self.queue: List[Tuple[float, int]] = []
+        self.clients: Dict[str, WikiClient] = {}
+        self.syncs: int = 0
+        self.finalized: int = 0
+        self._stop = threading.Event()
+
+    def stop(self, *args: Any) -> None:
+        """Signal handler; the current sync stops after its book"""
+        if not self._stop.is_set():
+            logger.info("Shutdown requested, stopping after the current book")
+        self._stop.set()
+
+    def client(self, lang: str) -> WikiClient:
+        ws = self.clients.get(lang)
+        if ws is None:
+            ws = self.clients[lang] = WikiClient(lang, USER_AGENT)
+            ws.keep_warm()
+        return ws
+
+    def schedule(self, contest: ScheduledContest, delay: float) -> None:
+        contest.due = time.monotonic() + delay
+        heapq.heappush(self.queue, (contest.due, contest.cid))
+
+    def next_interval(self, contest: ScheduledContest, changed_pages: int) -> float:
+        if changed_pages or contest.ends_at - dt.datetime.now() <= self.urgent_window:
+            return self.min_interval
+        return min(contest.interval * 2, self.max_interval)
+
+    def rescan(self) -> None:
+        """Pick up new contests and changed end dates, and forget contests that were turned off"""
+        with self.app.app_context():
+            running = {
+                contest.cid: contest
+                for contest in db.session.scalars(db.select(Contest).where(Contest.status.is_(True)))
+            }
+            for cid in list(self.contests):
+                if cid not in running:
+                    logger.info("Contest %s is no longer running, dropping it", self.contests.pop(cid).name)
+            for cid, contest in running.items():
+                scheduled = self.contests.get(cid)
+                if scheduled is None:
+                    scheduled = self.contests[cid] = ScheduledContest(
+                        cid, contest.name, contest.lang, contest_window(contest)[1], self.min_interval, 0.0
+                    )
+                    logger.info("Scheduling contest %s (ID: %s)", contest.name, cid)
+                    self.schedule(scheduled, 0)
+                else:
+                    scheduled.name, scheduled.lang = contest.name, contest.lang
+                    scheduled.ends_at = contest_window(contest)[1]
+
+    def sync(self, scheduled: ScheduledContest) -> Optional[int]:
+        """Sync one contest, finalizing it if it has ended; returns its changed pages, ``None`` once finalized"""
+        stats = SyncStats()
+        ended = dt.datetime.now() >= scheduled.ends_at
+
+        def book_done(book_name: str) -> None:
+            if self._stop.is_set():
+                raise ShutdownRequested(book_name)
+
+        with self.app.app_context():
+            contest: Optional[Contest] = db.session.get(Contest, scheduled.cid)
+            if contest is None or not contest.status:
+                return None
+            if contest.cid in contests_with_running_jobs():
+                logger.info("Contest %s is being synced by its setup job, trying again later", contest.name)
+                return 0
+            checkpoints = {key: checkpoint for key, checkpoint in load_checkpoints().items() if key[0] == contest.cid}
+            ws = self.client(contest.lang)
+            ws.on_request = stats.recorder()
+            ws.on_cache = stats.cache_recorder()
+            with stats.contest(contest.cid, contest.name):
+                try:
+                    sync_contest(ws, contest, UserCache([contest.cid]), checkpoints, on_book=book_done, stats=stats)
+                except ShutdownRequested as e:
+                    logger.info("Stopped contest %s after book %s, it resumes on the next start", contest.name, e)
+                    raise
+            clear_checkpoints(completed_only=True, contest_cid=contest.cid)
+            if ended:
+                ensure_leaderboard(contest, full=True)
+                contest.status = False
+                bump_generation()
+            db.session.commit()
+
+        totals = stats.summary()["totals"]
+        self.syncs += 1
+        logger.info(
+            "Synced contest %s: %d pages, %d changed, %d errors in %.1fs",
+            scheduled.name, totals["pages"], totals["changed_pages"], totals["errors"],
+            stats.contests[scheduled.cid]["seconds"],
+        )
+        if ended:
+            self.finalized += 1
+            logger.info("Contest %s has ended, finalized and dropped", scheduled.name)
+            return None
+        return totals["changed_pages"]
+
+    def run_once(self) -> bool:
+        """Sync the contest that is due first, if any is; returns whether one was synced"""
+        while self.queue:
+            due, cid = self.queue[0]
+            scheduled = self.contests.get(cid)
+            if scheduled is None or scheduled.due != due:
+                heapq.heappop(self.queue)
+                continue
+            if due > time.monotonic():
+                return False
+            heapq.heappop(self.queue)
+            try:
+                changed_pages = self.sync(scheduled)
+            except ShutdownRequested:
+                raise
+            except Exception as e:
+                logger.error("Error syncing contest %s: %s", scheduled.name, e)
+                changed_pages = 0
+            if changed_pages is None:
+                self.contests.pop(cid, None)
+            else:
+                scheduled.interval = self.next_interval(scheduled, changed_pages)
+                logger.info("Contest %s is next due in %ds", scheduled.name, scheduled.interval)
+                self.schedule(scheduled, scheduled.interval)
+            return True
+        return False
+
+    def run(self) -> None:
+        logger.info(
+            "Sync daemon started: intervals %ds to %ds, urgent within %s of the end",
+            self.min_interval, self.max_interval, self.urgent_window,
+        )
+        next_rescan = 0.0
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() >= next_rescan:
+                    try:
+                        self.rescan()
+                    except Exception as e:
+                        logger.error("Could not load the running contests: %s", e)
+                    next_rescan = time.monotonic() + self.rescan_interval
+                if self.run_once():
+                    continue
+                next_due = self.queue[0][0] if self.queue else next_rescan
+                self._stop.wait(max(0.0, min(next_due, next_rescan) - time.monotonic()))
+        except ShutdownRequested:
+            pass
+        finally:
+            for ws in self.clients.values():
+                ws.close()
+            logger.info("Sync daemon stopped after %d syncs, %d contests finalized", self.syncs, self.finalized)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description="Keep the running contests in sync with Wikisource")
+    arg_parser.add_argument("--min-interval", type=float, help="seconds, SYNC_DAEMON_MIN_INTERVAL by default")
+    arg_parser.add_argument("--max-interval", type=float, help="seconds, SYNC_DAEMON_MAX_INTERVAL by default")
+    args = arg_parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    from app import app
+
+    daemon = SyncDaemon(app, args.min_interval, args.max_interval)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Where the time of a sync run goes, per contest and book.
+
+``SyncStats`` collects API calls (by kind, with latency percentiles), time
+spent in SQL statements, pages scanned and rows written. It is attached to
+the Wikisource clients and the database engine for the duration of a run and
+written out as a JSON summary at the end.
+"""
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import datetime as dt
+import json
+import logging
+import math
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of ``values``, 0 when empty"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def request_kind(params: Dict[str, Any]) -> str:
+    """Short name of an API request, used to group latencies"""
+    if params.get("list") == "proofreadpagesinindex":
+        return "page_list"
+    if "proofread" in str(params.get("prop", "")):
+        return "latest_revisions"
+    return "history"
+
+
+class BookStats:
+    def __init__(self, contest_cid: Optional[int] = None, book_name: Optional[str] = None, wiki: Optional[str] = None) -> None:
+        self.contest_cid = contest_cid
+        self.book_name = book_name
+        self.wiki = wiki
+        self.seconds: float = 0.0
+        self.db_seconds: float = 0.0
+        self.pages: int = 0
+        self.changed_pages: int = 0
+        self.failed_pages: int = 0
+        self.inserted: int = 0
+        self.updated: int = 0
+        self.cache_hits: int = 0
+        self.cache_misses: int = 0
+        # request kind -> latencies in seconds
+        self.api: Dict[str, List[float]] = {}
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "book": self.book_name,
+            "seconds": round(self.seconds, 3),
+            "db_seconds": round(self.db_seconds, 3),
+            "pages": self.pages,
+            "changed_pages": self.changed_pages,
+            "failed_pages": self.failed_pages,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "pages_per_second": round(self.pages / self.seconds, 1) if self.seconds else None,
+            "page_cache": {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": round(self.cache_hits / lookups, 3) if lookups else None,
+            },
+            "api": {
+                kind: {
+                    "calls": len(latencies),
+                    "seconds": round(sum(latencies), 3),
+                    "p50": round(percentile(latencies, 0.5), 4),
+                    "p90": round(percentile(latencies, 0.9), 4),
+                    "p99": round(percentile(latencies, 0.99), 4),
+                    "max": round(max(latencies), 4),
+                }
+                for kind, latencies in sorted(self.api.items())
+            },
+        }
+
+
+class SyncStats:
+    def __init__(self) -> None:
+        self.started_at: dt.datetime = dt.datetime.utcnow()
+        self.finished_at: Optional[dt.datetime] = None
+        self.contests: Dict[int, Dict[str, Any]] = {}
+        self.wikis: Dict[str, Dict[str, Any]] = {}
+        self.books: List[BookStats] = []
+        self.errors: int = 0
+        # Throttling and retries per wiki at the end of the run, see rate_control.py
+        self.rate_control: Dict[str, Dict[str, Any]] = {}
+        # Work done outside of a book, e.g. leaderboard rebuilds
+        self.outside_books: BookStats = BookStats()
+        # The book each syncing thread is working on
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._engine: Optional[Engine] = None
+
+    def attach(self, engine: Engine) -> None:
+        """Count the time of every SQL statement run on ``engine`` until ``detach``"""
+        self._engine = engine
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def detach(self) -> None:
+        if self._engine is not None:
+            event.remove(self._engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(self._engine, "after_cursor_execute", self._after_cursor_execute)
+            self._engine = None
+
+    def _slot(self) -> SimpleNamespace:
+        slot: Optional[SimpleNamespace] = getattr(self._local, "slot", None)
+        if slot is None:
+            slot = self._local.slot = SimpleNamespace(book=self.outside_books)
+        return slot
+
+    def _before_cursor_execute(self, conn: Any, *args: Any) -> None:
+        conn.info["sync_stats_start"] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn: Any, *args: Any) -> None:
+        self._slot().book.db_seconds += time.perf_counter() - conn.info.pop("sync_stats_start", time.perf_counter())
+
+    def recorder(self) -> Callable[[Dict[str, Any], float], None]:
+        """``WikiClient.on_request`` hook for a client used by the calling thread.
+
+        Requests are credited to the book that thread is syncing, even when they
+        are made from the client's fetching threads.
+        """
+        slot = self._slot()
+
+        def record(params: Dict[str, Any], seconds: float) -> None:
+            with self._lock:
+                slot.book.api.setdefault(request_kind(params), []).append(seconds)
+
+        return record
+
+    def cache_recorder(self) -> Callable[[int, int], None]:
+        """``WikiClient.on_cache`` hook, crediting lookups like ``recorder`` does requests"""
+        slot = self._slot()
+
+        def record(hits: int, misses: int) -> None:
+            with self._lock:
+                slot.book.cache_hits += hits
+                slot.book.cache_misses += misses
+
+        return record
+
+    @contextmanager
+    def contest(self, contest_cid: int, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.contests[contest_cid] = {"id": contest_cid, "name": name, "seconds": round(time.perf_counter() - start, 3)}
+
+    @contextmanager
+    def wiki(self, lang: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.wikis[lang] = {"wiki": lang, "seconds": round(time.perf_counter() - start, 3)}
+
+    @contextmanager
+    def book(self, contest_cid: int, book_name: str, wiki: Optional[str] = None) -> Iterator[BookStats]:
+        book = BookStats(contest_cid, book_name, wiki)
+        slot = self._slot()
+        slot.book = book
+        start = time.perf_counter()
+        try:
+            yield book
+        finally:
+            book.seconds = time.perf_counter() - start
+            slot.book = self.outside_books
+            with self._lock:
+                self.books.append(book)
+            logger.info(
+                "Book %s: %d pages (%d changed, %d failed) in %.1fs, %d API calls, %.1fs in SQL, %d inserted, %d updated",
+                book_name, book.pages, book.changed_pages, book.failed_pages, book.seconds,
+                sum(len(latencies) for latencies in book.api.values()), book.db_seconds, book.inserted, book.updated,
+            )
+
+    def summary(self) -> Dict[str, Any]:
+        finished_at = self.finished_at or dt.datetime.utcnow()
+        totals = BookStats()
+        for book in self.books:
+            totals.seconds += book.seconds
+            totals.db_seconds += book.db_seconds
+            for field in ("pages", "changed_pages", "failed_pages", "inserted", "updated", "cache_hits", "cache_misses"):
+                setattr(totals, field, getattr(totals, field) + getattr(book, field))
+            for kind, latencies in book.api.items():
+                totals.api.setdefault(kind, []).extend(latencies)
+        total = totals.as_dict()
+        del total["book"]
+        total["errors"] = self.errors
+        total["db_seconds_outside_books"] = round(self.outside_books.db_seconds, 3)
+        return {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": finished_at.isoformat(),
+            "seconds": round((finished_at - self.started_at).total_seconds(), 3),
+            "totals": total,
+            "rate_control": self.rate_control,
+            "contests": [
+                {**contest, "books": [book.as_dict() for book in self.books if book.contest_cid == cid]}
+                for cid, contest in self.contests.items()
+            ],
+            "wikis": [
+                {**wiki, "books": [book.as_dict() for book in self.books if book.wiki == lang]}
+                for lang, wiki in self.wikis.items()
+            ],
+        }
+
+    def write(self, path: str) -> None:
+        self.finished_at = self.finished_at or dt.datetime.utcnow()
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        logger.info("Sync summary written to %s", path)
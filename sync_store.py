@@ -0,0 +1,367 @@
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import datetime as dt
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.dialects import mysql, sqlite
+
+from config import config
+from extensions import db
+from models import (
+    Contest,
+    ContestUserScore,
+    ContributionRollup,
+    IndexPage,
+    SyncCheckpoint,
+    User,
+    book_contest_association_table,
+    user_contest_association_table,
+)
+
+CHECKPOINT_COLUMNS: List[str] = ["page_count", "pages_done", "max_revid", "min_failed_revid", "completed"]
+
+SCORE_COLUMNS: List[str] = ["proofread_count", "validated_count", "points"]
+
+# strftime pattern of the start of a time bucket, the same on MySQL and SQLite
+BUCKET_FORMATS: Dict[str, str] = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+
+# Columns refreshed when an index page already exists
+PAGE_STATUS_COLUMNS: List[str] = [
+    "proofreader_username",
+    "proofread_time",
+    "p_revision_id",
+    "validator_username",
+    "validate_time",
+    "v_revision_id",
+]
+
+
+def load_watermarks(contest_cid: int) -> Dict[str, Optional[int]]:
+    """Last processed revision id of every book in a contest, ``None`` if never synced"""
+    rows = db.session.execute(
+        select(book_contest_association_table.c.book_name, book_contest_association_table.c.last_revid)
+        .where(book_contest_association_table.c.contest_cid == contest_cid)
+    )
+    return {book_name: last_revid for book_name, last_revid in rows}
+
+
+def book_watermarks(book_name: str, contest_cids: List[int]) -> Dict[int, Optional[int]]:
+    """Last processed revision id of a book in each of ``contest_cids``"""
+    rows = db.session.execute(
+        select(book_contest_association_table.c.contest_cid, book_contest_association_table.c.last_revid)
+        .where(book_contest_association_table.c.book_name == book_name)
+        .where(book_contest_association_table.c.contest_cid.in_(contest_cids))
+    )
+    return {contest_cid: last_revid for contest_cid, last_revid in rows}
+
+
+def save_watermark(contest_cid: int, book_name: str, last_revid: Optional[int]) -> None:
+    db.session.execute(
+        update(book_contest_association_table)
+        .where(book_contest_association_table.c.contest_cid == contest_cid)
+        .where(book_contest_association_table.c.book_name == book_name)
+        .values(last_revid=last_revid, synced_at=dt.datetime.utcnow())
+    )
+
+
+def insert_ignore(table: Any) -> Any:
+    """INSERT that silently skips rows colliding with an existing key"""
+    dialect: str = db.session.get_bind().dialect.name
+    if dialect == "mysql":
+        return mysql.insert(table).prefix_with("IGNORE")
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    raise NotImplementedError(f"No insert-ignore for the {dialect} dialect")
+
+
+class UserCache:
+    """Users and contest memberships known to the database, loaded once per sync run.
+
+    New users and memberships are collected in memory and written in bulk by ``flush``.
+    """
+
+    def __init__(self, contest_cids: Iterable[int]) -> None:
+        cids: List[int] = list(contest_cids)
+        self.users: Set[str] = set(db.session.scalars(select(User.user_name)))
+        self.memberships: Set[Tuple[int, str]] = set(
+            db.session.execute(
+                select(user_contest_association_table.c.contest_cid, user_contest_association_table.c.user_name)
+                .where(user_contest_association_table.c.contest_cid.in_(cids))
+            ).tuples()
+        ) if cids else set()
+        self.new_users: Set[str] = set()
+        self.new_memberships: Set[Tuple[int, str]] = set()
+
+    def add(self, contest_cid: int, user_name: str) -> None:
+        """Record that ``user_name`` took part in a contest"""
+        if user_name not in self.users:
+            self.users.add(user_name)
+            self.new_users.add(user_name)
+        if (contest_cid, user_name) not in self.memberships:
+            self.memberships.add((contest_cid, user_name))
+            self.new_memberships.add((contest_cid, user_name))
+
+    def flush(self) -> Tuple[int, int]:
+        """Write pending users and memberships, returns how many of each were written"""
+        counts = (len(self.new_users), len(self.new_memberships))
+        if self.new_users:
+            db.session.execute(
+                insert_ignore(User.__table__), [{"user_name": user_name} for user_name in self.new_users]
+            )
+        if self.new_memberships:
+            db.session.execute(
+                insert_ignore(user_contest_association_table),
+                [{"contest_cid": cid, "user_name": user_name} for cid, user_name in self.new_memberships],
+            )
+        self.new_users.clear()
+        self.new_memberships.clear()
+        return counts
+
+
+def _upsert(table: Any, key_columns: List[str], columns: List[str], only_if: Any = None) -> Any:
+    """INSERT that updates ``columns`` of the existing row on a key collision.
+
+    ``only_if`` builds an extra condition from the proposed row; it is only
+    applied on SQLite, MySQL skips writes that would not change the row by itself.
+    """
+    dialect: str = db.session.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in columns})
+    if dialect == "sqlite":
+        stmt = sqlite.insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={column: stmt.excluded[column] for column in columns},
+            where=only_if(stmt.excluded) if only_if is not None else None,
+        )
+    raise NotImplementedError(f"No upsert for the {dialect} dialect")
+
+
+def new_checkpoint() -> Dict[str, Any]:
+    return {"page_count": None, "pages_done": 0, "max_revid": None, "min_failed_revid": None, "completed": False}
+
+
+def load_checkpoints() -> Dict[Tuple[int, str], Dict[str, Any]]:
+    """Checkpoints left by an interrupted run, keyed by ``(contest_cid, book_name)``"""
+    return {
+        (checkpoint.contest_cid, checkpoint.book_name): {column: getattr(checkpoint, column) for column in CHECKPOINT_COLUMNS}
+        for checkpoint in db.session.scalars(select(SyncCheckpoint))
+    }
+
+
+def save_checkpoint(contest_cid: int, book_name: str, checkpoint: Dict[str, Any]) -> None:
+    db.session.execute(
+        _upsert(SyncCheckpoint.__table__, ["contest_cid", "book_name"], CHECKPOINT_COLUMNS + ["updated_at"]),
+        {"contest_cid": contest_cid, "book_name": book_name, "updated_at": dt.datetime.utcnow(), **checkpoint},
+    )
+
+
+def clear_checkpoints(
+    completed_only: bool = False,
+    contest_cid: Optional[int] = None,
+    book_names: Optional[Iterable[str]] = None,
+    skip_contests: Iterable[int] = (),
+) -> None:
+    stmt = delete(SyncCheckpoint)
+    if contest_cid is not None:
+        stmt = stmt.where(SyncCheckpoint.contest_cid == contest_cid)
+    skipped: List[int] = list(skip_contests)
+    if skipped:
+        stmt = stmt.where(SyncCheckpoint.contest_cid.not_in(skipped))
+    if book_names is not None:
+        stmt = stmt.where(SyncCheckpoint.book_name.in_(list(book_names)))
+    if completed_only:
+        stmt = stmt.where(SyncCheckpoint.completed.is_(True))
+    db.session.execute(stmt)
+
+
+def existing_pages_query(book_name: str, page_names: List[str]) -> Any:
+    return (
+        select(
+            IndexPage.page_name,
+            IndexPage.p_revision_id,
+            IndexPage.v_revision_id,
+            IndexPage.proofreader_username,
+            IndexPage.validator_username,
+        )
+        .where(IndexPage.book_name == book_name)
+        .where(IndexPage.page_name.in_(page_names))
+    )
+
+
+def upsert_index_pages(book_name: str, rows: List[Dict[str, Any]]) -> Tuple[int, int, Set[str]]:
+    """Insert or update the index pages of one book.
+
+    Rows whose proofread and validate revision ids did not move are not written at all.
+    Returns ``(inserted, updated, users)`` where ``users`` holds everyone credited
+    before or after the change, i.e. whose score may have moved.
+    """
+    if not rows:
+        return 0, 0, set()
+    existing: Dict[str, Tuple[Optional[int], Optional[int], Optional[str], Optional[str]]] = {
+        page_name: (p_revision_id, v_revision_id, proofreader, validator)
+        for page_name, p_revision_id, v_revision_id, proofreader, validator in db.session.execute(
+            existing_pages_query(book_name, [row["page_name"] for row in rows])
+        )
+    }
+    changed = [
+        row for row in rows
+        if existing.get(row["page_name"], ())[:2] != (row["p_revision_id"], row["v_revision_id"])
+    ]
+    users: Set[str] = set()
+    for row in changed:
+        users.update((row["proofreader_username"], row["validator_username"]))
+        users.update(existing.get(row["page_name"], ())[2:])
+    users.discard(None)
+    if changed:
+        table = IndexPage.__table__
+        stmt = _upsert(
+            table,
+            ["book_name", "page_name"],
+            PAGE_STATUS_COLUMNS,
+            only_if=lambda proposed: or_(
+                table.c.p_revision_id.is_distinct_from(proposed.p_revision_id),
+                table.c.v_revision_id.is_distinct_from(proposed.v_revision_id),
+            ),
+        )
+        chunk_size: int = config["SYNC_CHUNK_SIZE"]
+        for start in range(0, len(changed), chunk_size):
+            db.session.execute(stmt, changed[start:start + chunk_size])
+    inserted = sum(1 for row in changed if row["page_name"] not in existing)
+    return inserted, len(changed) - inserted, users
+
+
+def contest_window(contest: Contest) -> Tuple[dt.datetime, dt.datetime]:
+    """Start and exclusive end of the period in which edits count for a contest"""
+    # end_date is a date, the whole last day counts
+    return contest.start_date, contest.end_date + dt.timedelta(days=1)
+
+
+def credited_counts_query(contest: Contest, user_column: Any, time_column: Any, user_names: Optional[List[str]]) -> Any:
+    """Pages of the contest's books credited to each user inside the contest window"""
+    window_start, window_end = contest_window(contest)
+    stmt = (
+        select(user_column, func.count())
+        .select_from(IndexPage)
+        .join(book_contest_association_table, book_contest_association_table.c.book_name == IndexPage.book_name)
+        .where(book_contest_association_table.c.contest_cid == contest.cid)
+        .where(user_column.is_not(None))
+        .where(time_column >= window_start)
+        .where(time_column < window_end)
+        .group_by(user_column)
+    )
+    if user_names is not None:
+        stmt = stmt.where(user_column.in_(user_names))
+    return stmt
+
+
+def _credited_counts(contest: Contest, user_column: Any, time_column: Any, user_names: Optional[List[str]]) -> Dict[str, int]:
+    stmt = credited_counts_query(contest, user_column, time_column, user_names)
+    return {user_name: count for user_name, count in db.session.execute(stmt)}
+
+
+def refresh_scores(contest: Contest, user_names: Optional[Iterable[str]] = None) -> int:
+    """Recompute ``contest_user_score`` rows of a contest, returns how many were written.
+
+    Only ``user_names`` are recomputed when given, otherwise the whole leaderboard
+    is rebuilt, e.g. after the contest window or point values changed. Either way
+    the leaderboard lists the contest's members and anyone credited in it.
+    """
+    names: Optional[List[str]] = sorted(user_names) if user_names is not None else None
+    if names == []:
+        return 0
+    proofread = _credited_counts(contest, IndexPage.proofreader_username, IndexPage.proofread_time, names)
+    validated = _credited_counts(contest, IndexPage.validator_username, IndexPage.validate_time, names)
+    members_query = (
+        select(user_contest_association_table.c.user_name)
+        .where(user_contest_association_table.c.contest_cid == contest.cid)
+    )
+    if names is None:
+        db.session.execute(delete(ContestUserScore).where(ContestUserScore.contest_cid == contest.cid))
+        names = sorted(set(db.session.scalars(members_query)) | proofread.keys() | validated.keys())
+    else:
+        # Users credited only in another contest sharing the book have no place here
+        members: Set[str] = set(db.session.scalars(
+            members_query.where(user_contest_association_table.c.user_name.in_(names))
+        ))
+        outsiders: Set[str] = set(names) - members - proofread.keys() - validated.keys()
+        if outsiders:
+            db.session.execute(
+                delete(ContestUserScore)
+                .where(ContestUserScore.contest_cid == contest.cid)
+                .where(ContestUserScore.user_name.in_(sorted(outsiders)))
+            )
+            names = [user_name for user_name in names if user_name not in outsiders]
+    if not names:
+        return 0
+    rows = [
+        {
+            "contest_cid": contest.cid,
+            "user_name": user_name,
+            "proofread_count": proofread.get(user_name, 0),
+            "validated_count": validated.get(user_name, 0),
+            "points": proofread.get(user_name, 0) * (contest.point_per_proofread or 0)
+            + validated.get(user_name, 0) * (contest.point_per_validate or 0),
+        }
+        for user_name in names
+    ]
+    db.session.execute(
+        _upsert(ContestUserScore.__table__, ["contest_cid", "user_name"], SCORE_COLUMNS),
+        rows,
+    )
+    return len(rows)
+
+
+def has_scores(contest_cid: int) -> bool:
+    return db.session.scalar(
+        select(ContestUserScore.user_name).where(ContestUserScore.contest_cid == contest_cid).limit(1)
+    ) is not None
+
+
+def time_bucket(column: Any, bucket: str) -> Any:
+    """SQL expression of the start of the hour or day ``column`` falls in, as a string"""
+    dialect: str = db.session.get_bind().dialect.name
+    if dialect == "mysql":
+        return func.date_format(column, BUCKET_FORMATS[bucket])
+    if dialect == "sqlite":
+        return func.strftime(BUCKET_FORMATS[bucket], column)
+    raise NotImplementedError(f"No time buckets for the {dialect} dialect")
+
+
+def refresh_rollups(contest: Contest, user_names: Optional[Iterable[str]] = None) -> int:
+    """Recompute the hourly ``contribution_rollup`` rows of a contest, returns how many were written.
+
+    Like ``refresh_scores`` only ``user_names`` are recomputed when given.
+    """
+    names: Optional[List[str]] = sorted(user_names) if user_names is not None else None
+    if names == []:
+        return 0
+    buckets: Dict[Tuple[str, str], List[int]] = {}
+    for index, (user_column, time_column) in enumerate([
+        (IndexPage.proofreader_username, IndexPage.proofread_time),
+        (IndexPage.validator_username, IndexPage.validate_time),
+    ]):
+        hour = time_bucket(time_column, "hour")
+        stmt = credited_counts_query(contest, user_column, time_column, names).add_columns(hour).group_by(hour)
+        for user_name, count, bucket_start in db.session.execute(stmt):
+            buckets.setdefault((user_name, bucket_start), [0, 0])[index] = count
+
+    stmt = delete(ContributionRollup).where(ContributionRollup.contest_cid == contest.cid)
+    if names is not None:
+        stmt = stmt.where(ContributionRollup.user_name.in_(names))
+    db.session.execute(stmt)
+    if buckets:
+        db.session.execute(
+            ContributionRollup.__table__.insert(),
+            [
+                {
+                    "contest_cid": contest.cid,
+                    "user_name": user_name,
+                    "bucket_start": dt.datetime.strptime(bucket_start, BUCKET_FORMATS["hour"]),
+                    "proofread_count": proofread_count,
+                    "validated_count": validated_count,
+                }
+                for (user_name, bucket_start), (proofread_count, validated_count) in buckets.items()
+            ],
+        )
+    return len(buckets)
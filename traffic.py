@@ -0,0 +1,171 @@
+"""Recording and replay of the HTTP traffic between the sync and Wikisource.
+
+    python db_update.py --record crawl.jsonl.gz
+    python db_update.py --replay crawl.jsonl.gz [--replay-latency]
+
+A recording is a gzipped JSON line per response: URL, query, status, the
+headers the client acts on, body and how long it took. Replaying answers each
+request with the next recorded response to the same query, at full speed or
+after the recorded latency, so a production-sized crawl can be profiled
+offline. Throttled and failed responses are left out of a replay when the
+same query succeeded later in the recording: when the wiki pushed back depended
+on the timing of the recorded run, and replaying it would only add noise to
+comparisons between versions. For comparable runs, replay against a copy of the database as it was
+when the recording started, with the page status cache in the same state
+(``PAGE_CACHE_SIZE=0`` on both runs is simplest).
+"""
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple, Union
+import datetime as dt
+import gzip
+import json
+import logging
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION: int = 1
+
+# Response headers kept in recordings, those WikiClient looks at
+RECORDED_HEADERS: Tuple[str, ...] = ("Retry-After", "Content-Type")
+
+# Query parameters left out of the replay key; they do not change what a run asks for
+UNKEYED_PARAMS: Tuple[str, ...] = ("maxlag",)
+
+Key = Tuple[str, str]
+
+
+def request_key(url: str, params: Dict[str, Any]) -> Key:
+    return url, json.dumps(
+        {name: str(value) for name, value in params.items() if name not in UNKEYED_PARAMS}, sort_keys=True
+    )
+
+
+def failed(entry: Dict[str, Any]) -> bool:
+    """Whether a recorded response is a throttle or an error the client retries"""
+    if "error" in entry or entry["status"] == 429 or entry["status"] >= 500:
+        return True
+    try:
+        body = json.loads(entry["body"])
+    except ValueError:
+        return True
+    return isinstance(body, dict) and body.get("error", {}).get("code") == "maxlag"
+
+
+class ReplayMissError(Exception):
+    """A request that is not in the recording"""
+
+
+class Recorder:
+    """Sends requests for real and appends every response to ``path``"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.responses: int = 0
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._write({"version": FORMAT_VERSION, "recorded_at": dt.datetime.utcnow().isoformat()})
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def get(self, session: requests.Session, url: str, params: Dict[str, Any], timeout: float) -> requests.Response:
+        start = time.perf_counter()
+        entry: Dict[str, Any] = {"url": url, "params": {name: str(value) for name, value in params.items()}}
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except requests.RequestException as e:
+            entry.update(error=str(e), seconds=round(time.perf_counter() - start, 4))
+            self._write(entry)
+            raise
+        entry.update(
+            status=response.status_code,
+            headers={name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers},
+            body=response.text,
+            seconds=round(time.perf_counter() - start, 4),
+        )
+        self._write(entry)
+        self.responses += 1
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+        logger.info("Recorded %d responses to %s", self.responses, self.path)
+
+
+class Replayer:
+    """Answers requests from a recording, sleeping the recorded latency if ``latency`` is set"""
+
+    def __init__(self, path: str, latency: bool = False) -> None:
+        self.path = path
+        self.latency = latency
+        self.served: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+        # Responses to the same query in recorded order; the last one is kept to answer repeats
+        self._responses: Dict[Key, Deque[Dict[str, Any]]] = {}
+        count = 0
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if "version" in entry:
+                    if entry["version"] != FORMAT_VERSION:
+                        raise ValueError(f"{path} is a version {entry['version']} recording")
+                    continue
+                self._responses.setdefault(request_key(entry["url"], entry["params"]), deque()).append(entry)
+                count += 1
+        dropped = 0
+        for key, responses in self._responses.items():
+            if not all(failed(entry) for entry in responses):
+                kept = deque(entry for entry in responses if not failed(entry))
+                dropped += len(responses) - len(kept)
+                self._responses[key] = kept
+        logger.info(
+            "Loaded %d responses to %d requests from %s, %d throttled or failed ones left out",
+            count, len(self._responses), path, dropped,
+        )
+
+    def get(self, session: Optional[requests.Session], url: str, params: Dict[str, Any], timeout: float) -> requests.Response:
+        key = request_key(url, params)
+        with self._lock:
+            queue = self._responses.get(key)
+            if not queue:
+                self.misses += 1
+                raise ReplayMissError(f"No recorded response to {params}")
+            entry = queue.popleft() if len(queue) > 1 else queue[0]
+            self.served += 1
+        if self.latency:
+            time.sleep(entry["seconds"])
+        if "error" in entry:
+            raise requests.ConnectionError(entry["error"])
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers.update(entry["headers"])
+        response.encoding = "utf-8"
+        response._content = entry["body"].encode("utf-8")
+        response.url = url
+        return response
+
+    def close(self) -> None:
+        logger.info("Replayed %d responses from %s, %d requests were not in it", self.served, self.path, self.misses)
+
+
+Transport = Union[Recorder, Replayer]
+
+_transport: Optional[Transport] = None
+
+
+def install(transport: Optional[Transport]) -> None:
+    """Route the requests of every ``WikiClient`` through ``transport``, ``None`` for the network"""
+    global _transport
+    _transport = transport
+
+
+def installed() -> Optional[Transport]:
+    return _transport
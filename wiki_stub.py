@@ -0,0 +1,215 @@
+"""Local stand-in for the Wikisource API, used to exercise the sync without the network.
+
+    python wiki_stub.py --port 8089 --books 5 --pages 500 --latency 0.05
+    WIKISOURCE_API_URL="http://127.0.0.1:8089/{lang}/api.php" python db_update.py
+
+Books are named ``Stub_Book_<n>.djvu``; add them to a contest to have them crawled.
+The generated revision histories are deterministic for a given seed.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any
+from urllib.parse import parse_qs, urlparse
+import argparse
+import datetime as dt
+import json
+import random
+import threading
+import time
+
+PAGE_NS: int = 104
+BASE_TIME: dt.datetime = dt.datetime(2024, 1, 1)
+
+
+class StubWiki:
+    """Deterministic set of books, pages and proofread histories"""
+
+    def __init__(self, books: int = 3, pages: int = 100, users: int = 25, seed: int = 0) -> None:
+        self.seed = seed
+        self.users: List[str] = [f"StubUser{n}" for n in range(users)]
+        self.books: Dict[str, List[str]] = {
+            f"Stub_Book_{b}.djvu": [f"Page:Stub_Book_{b}.djvu/{p}" for p in range(1, pages + 1)]
+            for b in range(books)
+        }
+        self.page_ids: Dict[str, int] = {}
+        for titles in self.books.values():
+            for title in titles:
+                self.page_ids[title] = len(self.page_ids) + 1
+        self.edits: Dict[str, List[Dict[str, Any]]] = {}
+        self.next_revid: int = (len(self.page_ids) + 1) * 10
+
+    def edit(self, title: str, level: int, user: str) -> int:
+        """Simulate a new revision setting the page quality, returns its revid"""
+        revid = self.next_revid
+        self.next_revid += 1
+        last = self.revisions(title)[-1]
+        timestamp = dt.datetime.strptime(last["timestamp"], "%Y-%m-%dT%H:%M:%SZ") + dt.timedelta(hours=1)
+        content = f'<noinclude><pagequality level="{level}" user="{user}" /></noinclude>Text of {title}'
+        self.edits.setdefault(title, []).append({
+            "revid": revid,
+            "parentid": last["revid"],
+            "user": user,
+            "timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "size": len(content),
+            "slots": {"main": {"contentmodel": "proofread-page", "contentformat": "text/x-wiki", "*": content}},
+        })
+        return revid
+
+    def revisions(self, title: str) -> List[Dict[str, Any]]:
+        page_id = self.page_ids[title]
+        rng = random.Random(f"{self.seed}:{title}")
+        levels = [1]
+        if rng.random() < 0.7:
+            levels.append(3)
+            if rng.random() < 0.5:
+                levels.append(4)
+        timestamp = BASE_TIME + dt.timedelta(minutes=rng.randrange(60 * 24 * 30))
+        revs = []
+        for n, level in enumerate(levels):
+            user = rng.choice(self.users)
+            timestamp += dt.timedelta(minutes=rng.randrange(1, 60 * 24))
+            content = f'<noinclude><pagequality level="{level}" user="{user}" /></noinclude>Text of {title}'
+            revs.append({
+                "revid": page_id * 10 + n,
+                "parentid": page_id * 10 + n - 1 if n else 0,
+                "user": user,
+                "timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "size": len(content),
+                "slots": {"main": {"contentmodel": "proofread-page", "contentformat": "text/x-wiki", "*": content}},
+            })
+        return revs + self.edits.get(title, [])
+
+    def handle(self, params: Dict[str, str]) -> Dict[str, Any]:
+        if params.get("list") == "recentchanges":
+            return {"batchcomplete": "", "query": {"recentchanges": [
+                {"type": "edit", "revid": self.next_revid - 1, "old_revid": 0, "rcid": self.next_revid - 1}
+            ]}}
+        if params.get("list") == "proofreadpagesinindex":
+            book = params.get("prppiititle", "").split(":", 1)[-1]
+            if book not in self.books:
+                return {"error": {"code": "invalidtitle", "info": f"Index:{book} does not exist"}}
+            return {"batchcomplete": "", "query": {"proofreadpagesinindex": [
+                {"pageid": self.page_ids[title], "ns": PAGE_NS, "title": title} for title in self.books[book]
+            ]}}
+        if "proofread" in params.get("prop", "").split("|") or "|" in params.get("titles", ""):
+            return self.handle_batch(params)
+        if params.get("prop") == "revisions":
+            title = params.get("titles", "")
+            if title not in self.page_ids:
+                return {"batchcomplete": "", "query": {"pages": {"-1": {"ns": PAGE_NS, "title": title, "missing": ""}}}}
+            page_id = self.page_ids[title]
+            return {"batchcomplete": "", "query": {"pages": {str(page_id): {
+                "pageid": page_id, "ns": PAGE_NS, "title": title, "revisions": self.revisions(title),
+            }}}}
+        return {"error": {"code": "badvalue", "info": "Unsupported query for the stub"}}
+
+    def handle_batch(self, params: Dict[str, str]) -> Dict[str, Any]:
+        """Multi-title query: latest revision and proofread quality only, as the real API does"""
+        titles = params["titles"].split("|")
+        response: Dict[str, Any] = {"batchcomplete": "", "query": {"pages": {}}}
+        if len(titles) > 50:
+            response["warnings"] = {"query": {"*": "Too many values supplied for parameter \"titles\". The limit is 50."}}
+            titles = titles[:50]
+        props = params.get("prop", "").split("|")
+        missing = 0
+        for title in titles:
+            if title not in self.page_ids:
+                missing -= 1
+                response["query"]["pages"][str(missing)] = {"ns": PAGE_NS, "title": title, "missing": ""}
+                continue
+            page_id = self.page_ids[title]
+            latest = self.revisions(title)[-1]
+            page: Dict[str, Any] = {"pageid": page_id, "ns": PAGE_NS, "title": title}
+            if "revisions" in props:
+                page["revisions"] = [{"revid": latest["revid"], "parentid": latest["parentid"], "timestamp": latest["timestamp"]}]
+            if "proofread" in props:
+                level = int(latest["slots"]["main"]["*"].split('level="')[1][0])
+                page["proofread"] = {"quality": level, "quality_text": ["Without text", "Not proofread", "Problematic", "Proofread", "Validated"][level]}
+            response["query"]["pages"][str(page_id)] = page
+        return response
+
+
+def make_server(
+    stub: StubWiki,
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: float = 0.0,
+    max_in_flight: int = 0,
+    maxlag_rate: float = 0.0,
+) -> ThreadingHTTPServer:
+    """Build (but do not start) an HTTP server answering API queries from ``stub``.
+
+    Like Wikimedia's servers, it answers 429 beyond ``max_in_flight`` concurrent
+    requests, and a ``maxlag_rate`` fraction of requests with a maxlag error;
+    both come with a Retry-After of one second.
+    """
+    lock = threading.Lock()
+    in_flight = [0]
+    rng = random.Random(stub.seed)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            params = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+            with lock:
+                in_flight[0] += 1
+                status = 429 if max_in_flight and in_flight[0] > max_in_flight else 200
+                lagged = status == 200 and "maxlag" in params and rng.random() < maxlag_rate
+            try:
+                if latency:
+                    time.sleep(latency)
+                if status == 429:
+                    result: Dict[str, Any] = {"error": {"code": "ratelimited", "info": "Too many requests"}}
+                elif lagged:
+                    result = {"error": {"code": "maxlag", "info": "Waiting for a database server: 6 seconds lagged"}}
+                else:
+                    result = stub.handle(params)
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+            body = json.dumps(result).encode()
+            self.send_response(status)
+            if status == 429 or lagged:
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 256
+
+    return Server((host, port), Handler)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description="Serve a deterministic fake Wikisource API")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8089)
+    arg_parser.add_argument("--books", type=int, default=3)
+    arg_parser.add_argument("--pages", type=int, default=100, help="pages per book")
+    arg_parser.add_argument("--users", type=int, default=25)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    arg_parser.add_argument("--max-in-flight", type=int, default=0, help="answer 429 beyond this many concurrent requests")
+    arg_parser.add_argument("--maxlag-rate", type=float, default=0.0, help="fraction of requests failing with maxlag")
+    args = arg_parser.parse_args(argv)
+
+    server = make_server(
+        StubWiki(args.books, args.pages, args.users, args.seed), args.host, args.port, args.latency,
+        args.max_in_flight, args.maxlag_rate,
+    )
+    print(f"Serving stub Wikisource on http://{args.host}:{server.server_port}/{{lang}}/api.php")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any, Tuple, Union
+import logging
+import random
+import threading
+import time
+
+import requests
+from pywikisource import WikiSourceApi
+
+from config import config
+from page_cache import PageStatusCache, page_status_cache
+from rate_control import RateController, parse_retry_after, rate_controller
+import traffic
+
+logger = logging.getLogger(__name__)
+
+# The API accepts at most 50 titles per query for regular clients
+TITLES_PER_QUERY: int = 50
+
+
+class RetryableError(Exception):
+    """A request that failed in a way worth trying again"""
+
+    def __init__(self, message: str, throttled: Optional[str] = None, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.throttled = throttled
+        self.retry_after = retry_after
+
+
+class WikiRequestError(Exception):
+    """A request that still failed after its retries"""
+
+
+class InvalidIndexError(Exception):
+    """An Index page the wiki does not have, or will not list the pages of"""
+
+
+def concurrency_for(lang: str) -> int:
+    """Number of requests allowed in flight against one wiki"""
+    return max(1, config["SYNC_CONCURRENCY_PER_WIKI"].get(lang, config["SYNC_CONCURRENCY"]))
+
+
+class WikiClient(WikiSourceApi):
+    """WikiSourceApi with a configurable endpoint and concurrent page status fetching.
+
+    Every HTTP call goes through ``_get`` so the endpoint can be pointed at a
+    local stub (see ``wiki_stub.py``) through ``WIKISOURCE_API_URL``, and so
+    it is paced by the ``RateController`` of the wiki (see ``rate_control.py``)
+    and can be recorded or replayed (see ``traffic.py``).
+    """
+
+    def __init__(self, lang: str, user_agent: str, concurrency: Optional[int] = None) -> None:
+        super().__init__(lang, user_agent)
+        self.url_endpoint = config["WIKISOURCE_API_URL"].format(lang=lang)
+        self.concurrency: int = concurrency or concurrency_for(lang)
+        self.rate: RateController = rate_controller(self.url_endpoint, self.concurrency)
+        self._local = threading.local()
+        # Fetching threads kept between calls by ``keep_warm``, with their HTTP sessions
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # Called with the params and duration of every request, see sync_stats.py
+        self.on_request: Optional[Callable[[Dict[str, Any], float], None]] = None
+        self.cache: Optional[PageStatusCache] = page_status_cache()
+        # Called with the cache hits and misses of every batch_statuses call
+        self.on_cache: Optional[Callable[[int, int], None]] = None
+
+    def _session(self) -> requests.Session:
+        # requests.Session is not guaranteed to be thread-safe, keep one per worker thread
+        ses: Optional[requests.Session] = getattr(self._local, "session", None)
+        if ses is None:
+            ses = requests.Session()
+            ses.headers["User-Agent"] = self.userAgent
+            self._local.session = ses
+        return ses
+
+    def keep_warm(self) -> None:
+        """Reuse the fetching threads, and so their open connections, across calls until ``close``"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"ws-{self.lang}")
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _get(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a query, retrying it on throttling and transient failures.
+
+        Raises ``WikiRequestError`` once ``SYNC_MAX_ATTEMPTS`` attempts failed
+        or the retry budget of the wiki is spent.
+        """
+        if config["SYNC_MAXLAG"]:
+            params = {**params, "maxlag": config["SYNC_MAXLAG"]}
+        attempt = 1
+        while True:
+            try:
+                return self._attempt(params)
+            except RetryableError as e:
+                if attempt >= config["SYNC_MAX_ATTEMPTS"] or not self.rate.allow_retry():
+                    self.rate.record_give_up()
+                    raise WikiRequestError(f"{e} after {attempt} attempts") from e
+                logger.info("Retrying request to %s after attempt %d failed: %s", self.lang, attempt, e)
+                if e.throttled is None:
+                    # Throttled retries wait in RateController.acquire, others back off on their own
+                    time.sleep(min(2 ** (attempt - 1), 30) * random.uniform(0.5, 1.0))
+                attempt += 1
+
+    def _attempt(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.rate.acquire()
+        throttled: Tuple[Optional[str], Optional[float]] = (None, None)
+        start = time.perf_counter()
+        try:
+            transport = traffic.installed()
+            try:
+                if transport is None:
+                    response = self._session().get(self.url_endpoint, params=params, timeout=config["SYNC_REQUEST_TIMEOUT"])
+                else:
+                    response = transport.get(self._session(), self.url_endpoint, params, config["SYNC_REQUEST_TIMEOUT"])
+            except requests.RequestException as e:
+                raise RetryableError(str(e))
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status_code in (429, 503):
+                throttled = (str(response.status_code), retry_after)
+                raise RetryableError(f"HTTP {response.status_code}", *throttled)
+            if response.status_code >= 500:
+                raise RetryableError(f"HTTP {response.status_code}")
+            try:
+                data = response.json()
+            except ValueError:
+                raise RetryableError("response is not JSON")
+            if isinstance(data, dict) and data.get("error", {}).get("code") == "maxlag":
+                throttled = ("maxlag", retry_after)
+                raise RetryableError(data["error"].get("info", "maxlag"), *throttled)
+            return data
+        finally:
+            self.rate.release(*throttled)
+            if self.on_request is not None:
+                self.on_request(params, time.perf_counter() - start)
+
+    def createdPageList(self, index: str) -> List[str]:
+        try:
+            return self.index_pages(index)
+        except InvalidIndexError:
+            return []
+
+    def index_pages(self, index: str) -> List[str]:
+        """Titles of the pages of an index, ``InvalidIndexError`` if the wiki refuses the index"""
+        params = {
+            "action": "query",
+            "list": "proofreadpagesinindex",
+            "prppiititle": "Index:" + index,
+            "prppiiprop": "ids|title",
+            "format": "json",
+            "origin": "*",
+        }
+        data = self._get(params)
+        if isinstance(data, dict) and "error" in data:
+            raise InvalidIndexError(f"{data['error'].get('code')}: {data['error'].get('info')}")
+        try:
+            return [page["title"] for page in data["query"]["proofreadpagesinindex"]]
+        except (KeyError, TypeError):
+            return []
+
+    def pageStatus(self, page: str) -> Union[Dict[str, Any], bool]:
+        params = {
+            "action": "query",
+            "format": "json",
+            "prop": "revisions",
+            "titles": page,
+            "rvlimit": "max",
+            "rvdir": "newer",
+            "rvslots": "*",
+            "rvprop": "user|timestamp|content|ids|size",
+            "origin": "*",
+        }
+        try:
+            data = self._get(params)
+            revs = list(data["query"]["pages"].values())[0]["revisions"]
+            return self.analyzeRevisions(revs)
+        except Exception as e:
+            logger.warning("Could not fetch status of %s: %s", page, e)
+            return False
+
+    def page_statuses(self, pages: List[str]) -> Dict[str, Union[Dict[str, Any], bool]]:
+        """Fetch ``pageStatus`` for every page with up to ``concurrency`` requests in flight.
+
+        Results are returned to the caller thread, so database writes stay single-threaded.
+        """
+        if self.concurrency == 1 or len(pages) <= 1:
+            return {page: self.pageStatus(page) for page in pages}
+        if self._pool is not None:
+            return dict(zip(pages, self._pool.map(self.pageStatus, pages)))
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"ws-{self.lang}") as pool:
+            return dict(zip(pages, pool.map(self.pageStatus, pages)))
+
+    def latest_revisions(self, pages: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Latest revision id and proofread quality of every page, 50 titles per request.
+
+        Missing pages map to ``None``.
+        """
+        result: Dict[str, Optional[Dict[str, Any]]] = {}
+        for start in range(0, len(pages), TITLES_PER_QUERY):
+            batch = pages[start:start + TITLES_PER_QUERY]
+            params: Dict[str, Any] = {
+                "action": "query",
+                "format": "json",
+                "prop": "revisions|proofread",
+                "rvprop": "ids|timestamp",
+                "titles": "|".join(batch),
+                "origin": "*",
+            }
+            found: Dict[str, Dict[str, Any]] = {}
+            aliases: Dict[str, str] = {}
+            while True:
+                data = self._get(params)
+                if "error" in data:
+                    raise RuntimeError(f"{data['error'].get('code')}: {data['error'].get('info')}")
+                query = data.get("query", {})
+                for entry in query.get("normalized", []) + query.get("redirects", []):
+                    aliases[entry["from"]] = entry["to"]
+                for page in query.get("pages", {}).values():
+                    if "missing" in page or "invalid" in page:
+                        continue
+                    info = found.setdefault(page["title"], {"revid": None, "quality": None})
+                    for rev in page.get("revisions", []):
+                        if info["revid"] is None or rev["revid"] > info["revid"]:
+                            info["revid"] = rev["revid"]
+                            info["timestamp"] = rev.get("timestamp")
+                    if "proofread" in page:
+                        info["quality"] = int(page["proofread"]["quality"])
+                if "continue" not in data:
+                    break
+                params = {**params, **data["continue"]}
+            for title in batch:
+                result[title] = found.get(aliases.get(title, title))
+        return result
+
+    def latest_revid(self) -> Optional[int]:
+        """Newest revision id of the whole wiki, ``None`` if it has no recent edits"""
+        data = self._get({
+            "action": "query",
+            "format": "json",
+            "list": "recentchanges",
+            "rctype": "edit|new",
+            "rcprop": "ids",
+            "rclimit": 1,
+            "origin": "*",
+        })
+        if "error" in data:
+            raise RuntimeError(f"{data['error'].get('code')}: {data['error'].get('info')}")
+        changes = data.get("query", {}).get("recentchanges", [])
+        return changes[0]["revid"] if changes else None
+
+    def batch_statuses(
+        self, pages: List[str], latest: Optional[Dict[str, Optional[Dict[str, Any]]]] = None
+    ) -> Dict[str, Union[Dict[str, Any], bool]]:
+        """``pageStatus`` for many pages, using multi-title queries where the history is not needed.
+
+        Pages below "Proofread" quality cannot have a proofreader or validator, so they
+        are answered from the batched query alone. Only pages at quality 3 or 4 need
+        their full revision history, which is fetched concurrently. Every status also
+        carries the latest ``revid`` of the page. ``latest`` can be passed in when the
+        caller already ran ``latest_revisions`` for these pages. Histories are only
+        fetched for pages whose latest revision is not in the page status cache.
+        """
+        if latest is None:
+            latest = self.latest_revisions(pages)
+        result: Dict[str, Union[Dict[str, Any], bool]] = {}
+        need_history: List[str] = []
+        for page in pages:
+            info = latest[page]
+            if info is None:
+                result[page] = {"code": None, "proofread": None, "validate": None, "revid": None}
+            elif info["quality"] is not None and info["quality"] < 3:
+                result[page] = {"code": info["quality"], "proofread": None, "validate": None, "revid": info["revid"]}
+            else:
+                need_history.append(page)
+        cached: Dict[str, Dict[str, Any]] = {}
+        if self.cache is not None and need_history:
+            cached = self.cache.get_many(self.url_endpoint, {page: latest[page]["revid"] for page in need_history})
+            if self.on_cache is not None:
+                self.on_cache(len(cached), len(need_history) - len(cached))
+        fetched = self.page_statuses([page for page in need_history if page not in cached])
+        for page, status in fetched.items():
+            if status:
+                status["revid"] = latest[page]["revid"]
+            result[page] = status
+        if self.cache is not None:
+            self.cache.put_many(self.url_endpoint, {page: status for page, status in fetched.items() if status})
+        result.update(cached)
+        logger.debug(
+            "Resolved %d of %d pages from batched queries and %d from the cache",
+            len(pages) - len(need_history), len(pages), len(cached),
+        )
+        return result